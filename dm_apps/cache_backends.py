@@ -0,0 +1,172 @@
+import pickle
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache, RedisSerializer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# values whose pickle is smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = 1024
+# values that do not shrink below this ratio are stored uncompressed
+COMPRESSION_MAX_RATIO = 0.9
+
+# one byte header telling how the pickle was stored
+PLAIN = b"P"
+ZLIB = b"Z"
+ZSTD = b"S"
+
+_MISSING = object()
+
+
+class CompressedRedisSerializer(RedisSerializer):
+    """
+    Pickle values like django's RedisSerializer, but compress the large ones with zstd (or zlib if zstandard is not
+    installed). Integers are still stored as is so that incr() keeps working.
+    """
+
+    def dumps(self, obj):
+        data = super().dumps(obj)
+        if isinstance(data, int):
+            return data
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return PLAIN + data
+        if zstandard:
+            compressed = ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            compressed = ZLIB + zlib.compress(data, 6)
+        # already compressed content (e.g. gzipped responses) is not worth decompressing on every hit
+        if len(compressed) > len(data) * COMPRESSION_MAX_RATIO:
+            return PLAIN + data
+        return compressed
+
+    def loads(self, data):
+        try:
+            return int(data)
+        except ValueError:
+            pass
+        header, payload = data[:1], data[1:]
+        if header == ZSTD:
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        elif header == ZLIB:
+            payload = zlib.decompress(payload)
+        return pickle.loads(payload)
+
+
+class TieredRedisCache(RedisCache):
+    """
+    Redis cache with a small in-memory LRU tier in front of it, in each process. A hit on the local tier skips the
+    network round trip, the decompression and the unpickling altogether.
+
+    Local entries live for at most LOCAL_TIMEOUT seconds, so a value changed by another process could be seen late by
+    this one for that long. Only the keys matching LOCAL_KEY_PATTERN are kept locally: it should only match keys that
+    are never overwritten (e.g. versioned payload keys), every other key always goes to redis.
+
+    OPTIONS, on top of the RedisCache ones:
+        LOCAL_MAX_ENTRIES: number of values kept in memory (default 32)
+        LOCAL_TIMEOUT: seconds a value is kept in memory (default 30)
+        LOCAL_KEY_PATTERN: regular expression of the keys kept in memory, matched against the whole key (default
+        None, no key is kept in memory)
+    """
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        # the remaining options are passed to the redis client
+        self._options = dict(self._options)
+        self._local_max_entries = self._options.pop("LOCAL_MAX_ENTRIES", 32)
+        self._local_timeout = self._options.pop("LOCAL_TIMEOUT", 30)
+        local_key_pattern = self._options.pop("LOCAL_KEY_PATTERN", None)
+        self._local_key_pattern = re.compile(local_key_pattern) if local_key_pattern else None
+        self._local = OrderedDict()
+        self._local_lock = threading.Lock()
+
+    def keeps_locally(self, key):
+        """Whether the value of a key (as given by the caller) is kept in the in-memory tier"""
+        return bool(self._local_key_pattern and self._local_key_pattern.fullmatch(key))
+
+    def _local_get(self, key):
+        with self._local_lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expiry, value = entry
+            if expiry < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value, timeout=None):
+        local_timeout = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        if local_timeout <= 0 or self._local_max_entries <= 0:
+            return
+        with self._local_lock:
+            self._local[key] = (time.monotonic() + local_timeout, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, *keys):
+        with self._local_lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def clear_local(self):
+        """Empty the in-memory tier of this process only"""
+        with self._local_lock:
+            self._local.clear()
+
+    def get(self, key, default=None, version=None):
+        if not self.keeps_locally(key):
+            return super().get(key, default=default, version=version)
+        key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(key)
+        if value is _MISSING:
+            value = self._cache.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._local_set(key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        keeps_locally = self.keeps_locally(key)
+        key = self.make_and_validate_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        self._cache.set(key, value, timeout)
+        if keeps_locally:
+            self._local_set(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return super().add(key, value, timeout=timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return super().touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return super().delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return super().incr(key, delta=delta, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(*[self.make_and_validate_key(key, version=version) for key in data])
+        return super().set_many(data, timeout=timeout, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._local_delete(*[self.make_and_validate_key(key, version=version) for key in keys])
+        return super().delete_many(keys, version=version)
+
+    def clear(self):
+        self.clear_local()
+        return super().clear()
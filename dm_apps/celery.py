@@ -49,4 +49,13 @@ app.conf.beat_schedule = {
         'task': 'maintenance_reminder_email',
         'schedule': 60 * 60 * 12,  # execute every 12 hours
     },
+    # fisheriescape
+    'warm_score_cache': {
+        'task': 'warm_score_cache',
+        'schedule': 60 * 60,  # execute every hour, only the layers missing from the cache are rendered
+    },
+    'refresh_score_cube': {
+        'task': 'refresh_score_cube',
+        'schedule': 60 * 60,  # execute every hour, only rebuilt when the data changed
+    },
 }
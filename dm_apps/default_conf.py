@@ -7,6 +7,8 @@
 
 import os
 
+from decouple import config
+
 from .utils import db_connection_values_exist, get_db_connection_dict
 
 ########
@@ -79,10 +81,25 @@ DATABASES = {
 # CACHES    #
 #############
 
+# redis with a small in-process tier, large payloads are stored compressed (see dm_apps/cache_backends.py)
+REDIS_CACHE = {
+    'BACKEND': 'dm_apps.cache_backends.TieredRedisCache',
+    'LOCATION': config("REDIS_CACHE_URL", default="redis://localhost:6379/1"),
+    'OPTIONS': {
+        'serializer': 'dm_apps.cache_backends.CompressedRedisSerializer',
+        'LOCAL_MAX_ENTRIES': 32,
+        'LOCAL_TIMEOUT': 30,
+        # only the versioned payloads of fisheriescape.caching.get_cache_key, which are never overwritten
+        'LOCAL_KEY_PATTERN': r"fisheriescape:[\w-]+:\d+:[0-9a-f]{32}",
+    },
+}
+
 CACHES = {
-    'default': {
+    'default': REDIS_CACHE,
+    # 'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    # the former default cache, kept around to compare with (manage.py benchmark_score_cache)
+    'database': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        # 'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
         'LOCATION': 'cache',
-    }
+    },
 }
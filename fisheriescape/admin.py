@@ -1,6 +1,6 @@
 from django.contrib.gis import admin
 from .models import FisheryArea, MarineMammal, Week, Hexagon, Score, Mitigation, NAFOArea, VulnerableSpecies, \
-    VulnerableSpeciesSpot
+    VulnerableSpeciesSpot, SpeciesScoreStats, ImportJob
 
 admin.site.register(FisheryArea, admin.GeoModelAdmin)
 admin.site.register(NAFOArea, admin.GeoModelAdmin)
@@ -11,3 +11,5 @@ admin.site.register(Score, admin.ModelAdmin)
 admin.site.register(Mitigation, admin.ModelAdmin)
 admin.site.register(VulnerableSpecies, admin.ModelAdmin)
 admin.site.register(VulnerableSpeciesSpot, admin.ModelAdmin)
+admin.site.register(SpeciesScoreStats, admin.ModelAdmin)
+admin.site.register(ImportJob, admin.ModelAdmin)
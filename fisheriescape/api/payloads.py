@@ -0,0 +1,179 @@
+from rest_framework.renderers import JSONRenderer
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+from django.db.models import OuterRef, Subquery
+
+from .queries import get_combined_score_feature_collection, get_map_area_layers, get_score_timeseries, \
+    SEASON_WEEKS
+from .serializers import ScoreFeatureSerializer, get_season_score_stats
+from .. import models
+from fisheriescape.caching import get_cache_key, get_or_compute, compress_payload
+from fisheriescape.utils import FULL_RESOLUTION, DEFAULT_COORDINATE_PRECISION
+
+# rows fetched at a time from the server-side cursor of a streamed response, and features encoded per chunk sent
+STREAM_CHUNK_SIZE = 2000
+
+
+def get_score_feature_queryset(species=None, week=None, resolution=FULL_RESOLUTION, spatial_filter=None):
+    """
+    The scores of ScoreFeatureView, with their simplified hexagon when a resolution other than full is requested
+    :param spatial_filter: only the hexagons of these filters, see utils.get_spatial_filter_params
+    """
+    queryset = models.Score.objects.prefetch_related('week').prefetch_related('species').prefetch_related("hexagon")
+
+    if species:
+        queryset = queryset.filter(species__english_name=species)
+    if week is not None:
+        queryset = queryset.filter(week__week_number=week)
+    spatial_filter = spatial_filter or {}
+    if "bbox" in spatial_filter:
+        bbox = Polygon.from_bbox(spatial_filter["bbox"])
+        bbox.srid = 4326
+        queryset = queryset.filter(hexagon__polygon__intersects=bbox)
+    if "fishery_area" in spatial_filter:
+        queryset = queryset.filter(hexagon__area_overlaps__fishery_area_id=spatial_filter["fishery_area"])
+    if "nafo_area" in spatial_filter:
+        queryset = queryset.filter(hexagon__area_overlaps__nafo_area_id=spatial_filter["nafo_area"])
+    if "polygon" in spatial_filter:
+        queryset = queryset.filter(hexagon__polygon__intersects=GEOSGeometry(spatial_filter["polygon"], srid=4326))
+    if resolution != FULL_RESOLUTION:
+        # picked up by ScoreFeatureSerializer.get_hexagon instead of the full resolution hexagon polygon
+        queryset = queryset.annotate(simplified_polygon=Subquery(
+            models.SimplifiedPolygon.objects.filter(
+                layer="hexagon", resolution=resolution, object_id=OuterRef('hexagon_id')
+            ).values('polygon')[:1]
+        ))
+
+    return queryset
+
+
+def get_score_feature_payload(species=None, week=None, resolution=FULL_RESOLUTION,
+                              precision=DEFAULT_COORDINATE_PRECISION, spatial_filter=None, refresh=False,
+                              serve_stale=True):
+    """
+    The FeatureCollection of ScoreFeatureView, rendered and compressed (see caching.compress_payload). It is cached,
+    so that a hit costs no JSON encoding at all, and computed by one worker at a time (see caching.get_or_compute).
+    :param precision: number of decimals of the coordinates
+    :param spatial_filter: only the hexagons of these filters, see utils.get_spatial_filter_params
+    :param refresh: render it again even if it is cached
+    :param serve_stale: False to wait for the current payload rather than get a stale one (see caching.get_or_compute)
+    """
+    spatial_filter = spatial_filter or {}
+    cache_key = get_cache_key("scores-feature", species=species, week=week, resolution=resolution,
+                              precision=precision, **spatial_filter)
+
+    def render():
+        queryset = get_score_feature_queryset(species, week, resolution, spatial_filter)
+        serializer = ScoreFeatureSerializer(queryset, many=True, context={"precision": precision})
+        return compress_payload(JSONRenderer().render(serializer.data), cache_key=cache_key)
+
+    return get_or_compute(cache_key, render, refresh=refresh, serve_stale=serve_stale)
+
+
+def get_combined_score_feature_payload(species, week=None, resolution=FULL_RESOLUTION,
+                                       precision=DEFAULT_COORDINATE_PRECISION, spatial_filter=None, refresh=False,
+                                       serve_stale=True):
+    """
+    The FeatureCollection of ScoreFeatureCombinedView, compressed (see caching.compress_payload) and cached like
+    get_score_feature_payload.
+    :param spatial_filter: only the hexagons of these filters, see utils.get_spatial_filter_params
+    :param refresh: query it again even if it is cached
+    :param serve_stale: see get_score_feature_payload
+    """
+    species = sorted(species)
+    spatial_filter = spatial_filter or {}
+    cache_key = get_cache_key("scores-feature-combined", species=species, week=week, resolution=resolution,
+                              precision=precision, **spatial_filter)
+
+    def query():
+        feature_collection = get_combined_score_feature_collection(species=species, week=week, resolution=resolution,
+                                                                   precision=precision, spatial_filter=spatial_filter)
+        return compress_payload(feature_collection, cache_key=cache_key)
+
+    return get_or_compute(cache_key, query, refresh=refresh, serve_stale=serve_stale)
+
+
+def get_score_timeseries_payload(species, refresh=False, serve_stale=True):
+    """
+    The weekly fs_scores of the whole season of ScoreTimeseriesView, compressed (see caching.compress_payload) and
+    cached like get_score_feature_payload.
+    :param refresh: query them again even if they are cached
+    :param serve_stale: see get_score_feature_payload
+    """
+    species = sorted(species)
+    cache_key = get_cache_key("scores-timeseries", species=species)
+
+    def query():
+        max_fs_score, fs_score_breaks = get_season_score_stats(species)
+        header = JSONRenderer().render({
+            "weeks": SEASON_WEEKS,
+            "max_fs_score": max_fs_score,
+            "fs_score_breaks": fs_score_breaks,
+        })
+        # splice the series (already JSON encoded by the database) into the header object
+        content = header[:-1] + b',"series":' + get_score_timeseries(species).encode('utf-8') + b"}"
+        return compress_payload(content, cache_key=cache_key)
+
+    return get_or_compute(cache_key, query, refresh=refresh, serve_stale=serve_stale)
+
+
+def get_map_area_layers_payload(resolution=FULL_RESOLUTION, precision=DEFAULT_COORDINATE_PRECISION, refresh=False,
+                                serve_stale=True):
+    """
+    The area layers of the maps (see queries.MAP_AREA_LAYERS), compressed (see caching.compress_payload) and cached
+    like get_score_feature_payload. Polygon loads start a new data version, so they are never out of date.
+    :param refresh: query them again even if they are cached
+    :param serve_stale: see get_score_feature_payload
+    """
+    cache_key = get_cache_key("map-area-layers", resolution=resolution, precision=precision)
+
+    def query():
+        return compress_payload(get_map_area_layers(resolution=resolution, precision=precision), cache_key=cache_key)
+
+    return get_or_compute(cache_key, query, refresh=refresh, serve_stale=serve_stale)
+
+
+def stream_json_array(queryset, serializer, head=b"[", tail=b"]", chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Encode the objects of a queryset one at a time, as the items of a JSON array, read from a server-side cursor. Only
+    one chunk of objects is ever in memory, whatever the size of the queryset.
+    :param serializer: serializer instance whose to_representation encodes a single object
+    :param head: bytes sent before the items, ending with the opening bracket of the array
+    :param tail: bytes sent after the items, starting with the closing bracket of the array
+    """
+    renderer = JSONRenderer()
+    yield head
+    separator = b""
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(renderer.render(serializer.to_representation(obj)))
+        if len(chunk) == chunk_size:
+            yield separator + b",".join(chunk)
+            separator = b","
+            chunk = []
+    if chunk:
+        yield separator + b",".join(chunk)
+    yield tail
+
+
+def stream_score_feature_collection(species=None, week=None, resolution=FULL_RESOLUTION,
+                                    precision=DEFAULT_COORDINATE_PRECISION, spatial_filter=None,
+                                    chunk_size=STREAM_CHUNK_SIZE):
+    """
+    The FeatureCollection of ScoreFeatureView, encoded as it is read from the database (see stream_json_array). The
+    max_fs_score and fs_score_breaks header comes from the precomputed SpeciesScoreStats.
+    """
+    # joined rather than prefetched, the features are encoded as the rows come
+    queryset = get_score_feature_queryset(species, week, resolution, spatial_filter).prefetch_related(None) \
+        .select_related('week', 'species', 'hexagon').order_by('id')
+    species_names = [species] if species else \
+        queryset.order_by().values_list('species__english_name', flat=True).distinct()
+    max_fs_score, fs_score_breaks = get_season_score_stats(species_names)
+    header = JSONRenderer().render({
+        "type": "FeatureCollection",
+        "max_fs_score": max_fs_score,
+        "fs_score_breaks": fs_score_breaks,
+    })
+    # the features array is spliced into the header object
+    serializer = ScoreFeatureSerializer(context={"precision": precision})
+    yield from stream_json_array(queryset, serializer, head=header[:-1] + b',"features":[', tail=b"]}",
+                                 chunk_size=chunk_size)
@@ -0,0 +1,618 @@
+import math
+from array import array
+
+from django.db import connection
+
+from fisheriescape.utils import FULL_RESOLUTION, DEFAULT_COORDINATE_PRECISION
+
+# Raw PostGIS queries used by the api views. These bypass the ORM and the serializers altogether: the database
+# assembles the final payload and we hand the bytes straight back to the client.
+
+SIMPLIFIED_POLYGON_JOIN_SQL = """
+    LEFT JOIN fisheriescape_simplifiedpolygon simplified
+              ON simplified.layer = %(simplified_layer)s
+                  AND simplified.resolution = %(resolution)s
+                  AND simplified.object_id = {alias}.id
+"""
+
+
+def get_polygon_sql(layer, alias, resolution, params):
+    """
+    Return the join and the geometry expression that pick the simplified polygons of `resolution` for the `alias` table,
+    falling back on the original polygon where no simplified one was computed. The query parameters are added to params.
+    """
+    if resolution == FULL_RESOLUTION:
+        return "", f"{alias}.polygon"
+    params.update({"simplified_layer": layer, "resolution": resolution})
+    return SIMPLIFIED_POLYGON_JOIN_SQL.format(alias=alias), f"COALESCE(simplified.polygon, {alias}.polygon)"
+
+
+# the spatial filters of the score queries (see utils.get_spatial_filter_params), on the hexagon id column of a score
+HEXAGON_FILTER_SQL = {
+    "bbox": """{column} IN (SELECT id FROM fisheriescape_hexagon
+                           WHERE ST_Intersects(polygon, ST_MakeEnvelope(%(bbox_0)s, %(bbox_1)s, %(bbox_2)s, %(bbox_3)s,
+                                                                        4326)))""",
+    "fishery_area": """{column} IN (SELECT hexagon_id FROM fisheriescape_hexagonareaoverlap
+                                   WHERE fishery_area_id = %(fishery_area)s)""",
+    "nafo_area": """{column} IN (SELECT hexagon_id FROM fisheriescape_hexagonareaoverlap
+                                WHERE nafo_area_id = %(nafo_area)s)""",
+    "polygon": """{column} IN (SELECT id FROM fisheriescape_hexagon
+                              WHERE ST_Intersects(polygon, ST_GeomFromText(%(polygon)s, 4326)))""",
+}
+
+
+def get_hexagon_filter_sql(spatial_filter, column, params):
+    """
+    Return the conditions that keep the hexagons of a spatial filter, on the hexagon id `column`. The hexagons are
+    picked through the GiST index of their polygon (bbox, polygon) or the HexagonAreaOverlap table (areas). The query
+    parameters are added to params.
+    """
+    where = []
+    for name, value in (spatial_filter or {}).items():
+        if name == "bbox":
+            params.update({f"bbox_{i}": coordinate for i, coordinate in enumerate(value)})
+        else:
+            params[name] = value
+        where.append(HEXAGON_FILTER_SQL[name].format(column=column))
+    return where
+
+
+SCORE_TILE_LAYER_NAME = "scores"
+
+SCORE_TILE_SQL = """
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom_3857,
+               ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s), 4326) AS geom_4326
+    ),
+    tile_scores AS (
+        SELECT h.id AS hexagon_id,
+               h.grid_id,
+               h.polygon,
+               SUM(s.fs_score)::float8 AS fs_score,
+               STRING_AGG(sp.english_name, ',') AS species,
+               COUNT(s.id) AS species_count
+        FROM fisheriescape_score s
+                 JOIN fisheriescape_hexagon h ON h.id = s.hexagon_id
+                 JOIN fisheriescape_species sp ON sp.id = s.species_id
+                 JOIN fisheriescape_week w ON w.id = s.week_id,
+             bounds
+        WHERE h.polygon && bounds.geom_4326
+          AND sp.english_name = ANY(%(species)s)
+          AND w.week_number = %(week)s
+        GROUP BY h.id, h.grid_id, h.polygon
+    ),
+    mvt_geom AS (
+        SELECT ST_AsMVTGeom(ST_Transform(t.polygon, 3857), bounds.geom_3857) AS geom,
+               t.hexagon_id,
+               t.grid_id,
+               t.fs_score,
+               t.species,
+               t.species_count
+        FROM tile_scores t,
+             bounds
+    )
+    SELECT ST_AsMVT(mvt_geom.*, %(layer_name)s, 4096, 'geom', 'hexagon_id')
+    FROM mvt_geom
+"""
+
+
+def get_score_tile(z, x, y, species, week):
+    """
+    Build a Mapbox Vector Tile of the hexagon fs_scores intersecting tile z/x/y.
+    When more than one species is given, the scores are summed per hexagon (same as ScoreFeatureCombinedView).
+    :param z: zoom level
+    :param x: tile column
+    :param y: tile row
+    :param species: list of species english names
+    :param week: week number
+    :return: the encoded tile as bytes (empty bytes when there is nothing in the tile)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SCORE_TILE_SQL, {
+            "z": z,
+            "x": x,
+            "y": y,
+            "species": list(species),
+            "week": week,
+            "layer_name": SCORE_TILE_LAYER_NAME,
+        })
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] else b""
+
+
+COMBINED_SCORE_FEATURE_COLLECTION_SQL = """
+    WITH filtered_scores AS (
+        SELECT s.id, s.hexagon_id, s.species_id, s.week_id, s.fs_score, sp.english_name
+        FROM fisheriescape_score s
+                 JOIN fisheriescape_species sp ON sp.id = s.species_id
+                 JOIN fisheriescape_week w ON w.id = s.week_id
+        WHERE {where}
+    ),
+    combined_scores AS (
+        SELECT hexagon_id,
+               week_id,
+               SUM(fs_score)::float8 AS fs_score,
+               STRING_AGG(english_name, ',') AS species,
+               COUNT(id) AS species_count
+        FROM filtered_scores
+        GROUP BY hexagon_id, week_id
+    ),
+    species_max AS (
+        SELECT COALESCE(st.max_fs_score, (SELECT MAX(s.fs_score)::float8
+                                          FROM fisheriescape_score s
+                                          WHERE s.species_id = species_ids.species_id)) AS max_fs_score
+        FROM (SELECT DISTINCT species_id FROM filtered_scores) species_ids
+                 LEFT JOIN fisheriescape_speciesscorestats st
+                           ON st.species_id = species_ids.species_id AND st.week_id IS NULL
+    )
+    SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'max_fs_score', (SELECT COALESCE(SUM(max_fs_score), 0) FROM species_max),
+        'fs_score_breaks', NULL,
+        'features', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'type', 'Feature',
+                'geometry', ST_AsGeoJSON({geometry}, %(precision)s)::json,
+                'properties', json_build_object(
+                    'grid_id', h.grid_id,
+                    'species', c.species,
+                    'species_count', c.species_count,
+                    'week', 'Week ' || w.week_number,
+                    'fs_score', c.fs_score
+                )
+            )), '[]'::json)
+            FROM combined_scores c
+                     JOIN fisheriescape_hexagon h ON h.id = c.hexagon_id
+                     JOIN fisheriescape_week w ON w.id = c.week_id
+                     {join}
+        )
+    )::text
+"""
+
+
+def get_combined_score_feature_collection(species=None, week=None, resolution=FULL_RESOLUTION,
+                                          precision=DEFAULT_COORDINATE_PRECISION, spatial_filter=None):
+    """
+    Build the GeoJSON FeatureCollection of the fs_scores summed per hexagon and week over several species. The group by,
+    the hexagon geometry join and the GeoJSON assembly all happen in this one statement.
+    :param species: list of species english names; all species are combined when empty
+    :param week: optional week number
+    :param resolution: hexagon polygon resolution, see utils.GEOMETRY_RESOLUTIONS
+    :param precision: number of decimals of the coordinates
+    :param spatial_filter: only the hexagons of these filters, see utils.get_spatial_filter_params
+    :return: the encoded FeatureCollection as bytes
+    """
+    where = ["TRUE"]
+    params = {"precision": precision}
+    if species:
+        where.append("sp.english_name = ANY(%(species)s)")
+        params["species"] = list(species)
+    if week is not None:
+        where.append("w.week_number = %(week)s")
+        params["week"] = week
+    where += get_hexagon_filter_sql(spatial_filter, "s.hexagon_id", params)
+    join, geometry = get_polygon_sql("hexagon", "h", resolution, params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(COMBINED_SCORE_FEATURE_COLLECTION_SQL.format(where=" AND ".join(where), join=join,
+                                                                   geometry=geometry), params)
+        row = cursor.fetchone()
+    return row[0].encode('utf-8')
+
+
+HEXAGON_GRID_VERSION_SQL = """
+    SELECT COUNT(id), COALESCE(MAX(id), 0)
+    FROM fisheriescape_hexagon
+"""
+
+HEXAGON_GRID_SQL = """
+    SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'version', %(version)s,
+        'features', COALESCE(json_agg(json_build_object(
+            'type', 'Feature',
+            'id', h.id,
+            'geometry', ST_AsGeoJSON({geometry}, %(precision)s)::json,
+            'properties', json_build_object('grid_id', h.grid_id)
+        ) ORDER BY h.id), '[]'::json)
+    )::text
+    FROM fisheriescape_hexagon h
+    {join}
+"""
+
+SCORE_VALUES_SQL = """
+    WITH scores AS (
+        SELECT s.hexagon_id, SUM(s.fs_score)::float8 AS fs_score
+        FROM fisheriescape_score s
+                 JOIN fisheriescape_species sp ON sp.id = s.species_id
+                 JOIN fisheriescape_week w ON w.id = s.week_id
+        WHERE sp.english_name = ANY(%(species)s)
+          AND w.week_number = %(week)s
+        GROUP BY s.hexagon_id
+    )
+    SELECT {values_sql}
+"""
+
+SCORE_PAIRS_SQL = """
+    (SELECT COALESCE(json_agg(json_build_array(hexagon_id, fs_score) ORDER BY hexagon_id), '[]'::json)::text
+     FROM scores
+     WHERE fs_score IS NOT NULL)
+"""
+
+SCORE_DENSE_SQL = """
+    (SELECT COALESCE(json_agg(scores.fs_score ORDER BY h.id), '[]'::json)::text
+     FROM fisheriescape_hexagon h
+              LEFT JOIN scores ON scores.hexagon_id = h.id)
+"""
+
+
+def get_hexagon_grid_version():
+    """
+    The hexagon grid only changes when a shapefile is (re)loaded, so its row count and highest id are enough to tell
+    two versions apart.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(HEXAGON_GRID_VERSION_SQL)
+        count, max_id = cursor.fetchone()
+    return f"{count}-{max_id}"
+
+
+def get_hexagon_grid(version, resolution=FULL_RESOLUTION, precision=DEFAULT_COORDINATE_PRECISION):
+    """
+    Build the GeoJSON FeatureCollection of every hexagon, ordered by id. The feature id is the index used by
+    get_score_values()
+    :param version: the grid version, as returned by get_hexagon_grid_version()
+    :param resolution: polygon resolution, see utils.GEOMETRY_RESOLUTIONS
+    :param precision: number of decimals of the coordinates
+    :return: the encoded FeatureCollection as bytes
+    """
+    params = {"version": version, "precision": precision}
+    join, geometry = get_polygon_sql("hexagon", "h", resolution, params)
+    with connection.cursor() as cursor:
+        cursor.execute(HEXAGON_GRID_SQL.format(join=join, geometry=geometry), params)
+        row = cursor.fetchone()
+    return row[0].encode('utf-8')
+
+
+def get_score_values(species, week, dense=False):
+    """
+    Return only the fs_scores of a species/week (summed when there are several species), without any geometry.
+    :param species: list of species english names
+    :param week: week number
+    :param dense: if True, return one value per hexagon of the grid, in grid order (null where there is no score);
+    otherwise return [hexagon id, fs_score] pairs
+    :return: the JSON encoded array as a str
+    """
+    values_sql = SCORE_DENSE_SQL if dense else SCORE_PAIRS_SQL
+    with connection.cursor() as cursor:
+        cursor.execute(SCORE_VALUES_SQL.format(values_sql=values_sql), {"species": list(species), "week": week})
+        row = cursor.fetchone()
+    return row[0]
+
+
+# week numbers go from 1 to 53
+SEASON_WEEKS = 53
+
+SCORE_TIMESERIES_SQL = """
+    WITH scores AS (
+        SELECT s.hexagon_id, w.week_number, SUM(s.fs_score)::float AS fs_score
+        FROM fisheriescape_score s
+                 JOIN fisheriescape_species sp ON sp.id = s.species_id
+                 JOIN fisheriescape_week w ON w.id = s.week_id
+        WHERE sp.english_name = ANY(%(species)s)
+          AND w.week_number BETWEEN 1 AND %(weeks)s
+        GROUP BY s.hexagon_id, w.week_number
+    ),
+    series AS (
+        SELECT hexagons.hexagon_id, array_agg(scores.fs_score ORDER BY weeks.week_number) AS fs_scores
+        FROM (SELECT DISTINCT hexagon_id FROM scores) hexagons
+                 CROSS JOIN generate_series(1, %(weeks)s) weeks(week_number)
+                 LEFT JOIN scores ON scores.hexagon_id = hexagons.hexagon_id AND scores.week_number = weeks.week_number
+        GROUP BY hexagons.hexagon_id
+    )
+    {select}
+"""
+
+SCORE_TIMESERIES_JSON_SELECT = """
+    SELECT COALESCE(json_agg(json_build_array(hexagon_id, fs_scores) ORDER BY hexagon_id), '[]'::json)::text
+    FROM series
+"""
+
+SCORE_TIMESERIES_ROWS_SELECT = """
+    SELECT hexagon_id, fs_scores
+    FROM series
+    ORDER BY hexagon_id
+"""
+
+
+def get_score_timeseries(species):
+    """
+    Return the fs_scores of every week of the season (summed when there are several species), per hexagon.
+    :param species: list of species english names
+    :return: the JSON encoded [hexagon id, [fs_score of week 1, ..., fs_score of week 53]] array as a str, with null
+    for the weeks without a score
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SCORE_TIMESERIES_SQL.format(select=SCORE_TIMESERIES_JSON_SELECT),
+                       {"species": list(species), "weeks": SEASON_WEEKS})
+        row = cursor.fetchone()
+    return row[0]
+
+
+def get_score_timeseries_columns(species, chunk_size=10000):
+    """
+    Same as get_score_timeseries, as typed columns (see renderers.ScoreColumnsRenderer): the hexagon ids, and their
+    fs_scores as one flat array of SEASON_WEEKS values per hexagon, NaN for the weeks without a score.
+    """
+    columns = {"hexagon": array("i"), "fs_score": array("f")}
+    with connection.cursor() as cursor:
+        cursor.execute(SCORE_TIMESERIES_SQL.format(select=SCORE_TIMESERIES_ROWS_SELECT),
+                       {"species": list(species), "weeks": SEASON_WEEKS})
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for hexagon_id, fs_scores in rows:
+                columns["hexagon"].append(hexagon_id)
+                columns["fs_score"].extend(math.nan if fs_score is None else fs_score for fs_score in fs_scores)
+    return columns
+
+
+SCORE_COLUMNS = (
+    ("hexagon", "i"),
+    ("species", "i"),
+    ("week", "i"),
+    ("fs_score", "f"),
+    ("site_score", "f"),
+    ("ceu_score", "f"),
+)
+
+SCORE_COLUMNS_SQL = """
+    SELECT s.hexagon_id,
+           s.species_id,
+           w.week_number,
+           COALESCE(s.fs_score::float4, 'NaN'),
+           COALESCE(s.site_score::float4, 'NaN'),
+           COALESCE(s.ceu_score::float4, 'NaN')
+    FROM fisheriescape_score s
+             JOIN fisheriescape_species sp ON sp.id = s.species_id
+             JOIN fisheriescape_week w ON w.id = s.week_id
+    WHERE {where}
+    ORDER BY s.species_id, w.week_number, s.hexagon_id
+"""
+
+
+def get_score_columns(species=None, weeks=None, chunk_size=10000):
+    """
+    Fetch the scores of the given species and weeks as typed columns (python arrays) rather than one object per row.
+    Missing scores are NaN.
+    :param species: list of species english names; all species when empty
+    :param weeks: list of week numbers; all weeks when empty
+    :param chunk_size: number of rows fetched from the cursor at a time
+    :return: a dict of column name -> array, in SCORE_COLUMNS order
+    """
+    where = ["TRUE"]
+    params = {}
+    if species:
+        where.append("sp.english_name = ANY(%(species)s)")
+        params["species"] = list(species)
+    if weeks:
+        where.append("w.week_number = ANY(%(weeks)s)")
+        params["weeks"] = [int(week) for week in weeks]
+
+    columns = {name: array(typecode) for name, typecode in SCORE_COLUMNS}
+    with connection.cursor() as cursor:
+        cursor.execute(SCORE_COLUMNS_SQL.format(where=" AND ".join(where)), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            # transpose the chunk and extend each column in one go
+            for column, values in zip(columns.values(), zip(*rows)):
+                column.extend(values)
+    return columns
+
+
+AREA_FEATURE_COLLECTION_SQL = """
+    SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'features', COALESCE(json_agg(json_build_object(
+            'type', 'Feature',
+            'id', a.id,
+            'geometry', ST_AsGeoJSON({geometry}, %(precision)s)::json,
+            'properties', json_build_object(
+                'pk', a.id,
+                'name', a.name,
+                'layer_id', a.layer_id,
+                'region', {region}
+            )
+        ) ORDER BY a.layer_id, a.name), '[]'::json)
+    )::text
+    FROM {table} a
+    {join}
+    WHERE a.layer_id = %(layer_id)s
+"""
+
+AREA_LAYERS = {
+    # layer: (table, region expression)
+    "fishery_area": ("fisheriescape_fisheryarea", "a.region"),
+    "nafo_area": ("fisheriescape_nafoarea", "NULL"),
+}
+
+
+def get_area_feature_collection(layer, layer_id, resolution=FULL_RESOLUTION, precision=DEFAULT_COORDINATE_PRECISION):
+    """
+    Build the GeoJSON FeatureCollection of the FisheryArea or NAFOArea polygons of a layer_id (e.g. "Lobster"), with
+    the same properties as django's geojson serializer uses in the map templates.
+    :param layer: "fishery_area" or "nafo_area"
+    :param layer_id: the layer_id of the areas
+    :param resolution: polygon resolution, see utils.GEOMETRY_RESOLUTIONS
+    :param precision: number of decimals of the coordinates
+    :return: the FeatureCollection as a str
+    """
+    table, region = AREA_LAYERS[layer]
+    params = {"layer_id": layer_id, "precision": precision}
+    join, geometry = get_polygon_sql(layer, "a", resolution, params)
+    with connection.cursor() as cursor:
+        cursor.execute(AREA_FEATURE_COLLECTION_SQL.format(table=table, region=region, join=join, geometry=geometry),
+                       params)
+        row = cursor.fetchone()
+    return row[0]
+
+
+# the area layers of the maps: name: (layer, layer_id)
+MAP_AREA_LAYERS = {
+    "lobster_areas": ("fishery_area", "Lobster"),
+    "snow_crab_areas": ("fishery_area", "Crab"),
+    "herring_areas": ("fishery_area", "Herring"),
+    "groundfish_areas": ("fishery_area", "Groundfish"),
+    "nafo_sub_areas": ("fishery_area", "NAFO Subareas"),
+    "nafo_areas": ("nafo_area", "NAFO"),
+}
+
+
+def get_map_area_layers(resolution=FULL_RESOLUTION, precision=DEFAULT_COORDINATE_PRECISION):
+    """
+    Build a JSON object of the FeatureCollection of each of the MAP_AREA_LAYERS, by name.
+    :return: the JSON object as bytes
+    """
+    feature_collections = [
+        f'"{name}": {get_area_feature_collection(layer, layer_id, resolution=resolution, precision=precision)}'
+        for name, (layer, layer_id) in MAP_AREA_LAYERS.items()
+    ]
+    return f'{{{", ".join(feature_collections)}}}'.encode('utf-8')
+
+
+# how far around a hexagon the vulnerable species spots are counted, in degrees (about 5 km of latitude)
+HEXAGON_PROFILE_SPOT_DISTANCE = 0.05
+
+HEXAGON_PROFILE_AREAS_SELECT = """
+    (SELECT COALESCE(json_agg(json_build_object(
+        'pk', a.id,
+        'name', a.name,
+        'layer_id', a.layer_id,
+        'overlap_fraction', o.overlap_fraction
+    ) ORDER BY a.layer_id, a.name), '[]'::json)
+     FROM fisheriescape_hexagonareaoverlap o
+              JOIN {table} a ON a.id = o.{column}_id
+     WHERE o.hexagon_id = h.id)
+"""
+
+HEXAGON_PROFILE_SQL = """
+    SELECT json_build_object(
+        'id', h.id,
+        'grid_id', h.grid_id,
+        'scores', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'species', sp.english_name,
+                'week', w.week_number,
+                'fs_score', s.fs_score,
+                'site_score', s.site_score,
+                'ceu_score', s.ceu_score
+            ) ORDER BY sp.english_name, w.week_number), '[]'::json)
+            FROM fisheriescape_score s
+                     JOIN fisheriescape_species sp ON sp.id = s.species_id
+                     JOIN fisheriescape_week w ON w.id = s.week_id
+            WHERE s.hexagon_id = h.id
+        ),
+        'fishery_areas', {fishery_areas},
+        'nafo_areas', {nafo_areas},
+        'vulnerable_species_spots', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'vulnerable_species', spots.english_name,
+                'week', spots.week_number,
+                'spots', spots.spots,
+                'count', spots.count
+            ) ORDER BY spots.english_name, spots.week_number), '[]'::json)
+            FROM (
+                SELECT vs.english_name, w.week_number, COUNT(*) AS spots, SUM(s.count) AS count
+                FROM fisheriescape_vulnerablespeciesspot s
+                         JOIN fisheriescape_vulnerablespecies vs ON vs.id = s.vulnerable_species_id
+                         JOIN fisheriescape_week w ON w.id = s.week_id
+                WHERE ST_DWithin(s.point, h.polygon, %(distance)s)
+                GROUP BY vs.english_name, w.week_number
+            ) spots
+        )
+    )::text
+    FROM fisheriescape_hexagon h
+    WHERE h.grid_id = %(grid_id)s
+"""
+
+
+def get_hexagon_profile(grid_id, distance=HEXAGON_PROFILE_SPOT_DISTANCE):
+    """
+    Build the profile of a single hexagon: the fs/site/ceu scores of every species and week, the fishery and NAFO
+    areas it overlaps (from the precomputed HexagonAreaOverlap rows) and the vulnerable species spots around it,
+    counted per species and week. Every part is an indexed lookup on the hexagon.
+    :param grid_id: the grid_id of the hexagon
+    :param distance: how far around the hexagon the spots are counted, in degrees
+    :return: the JSON object as a str, None if there is no such hexagon
+    """
+    sql = HEXAGON_PROFILE_SQL.format(
+        fishery_areas=HEXAGON_PROFILE_AREAS_SELECT.format(table="fisheriescape_fisheryarea", column="fishery_area"),
+        nafo_areas=HEXAGON_PROFILE_AREAS_SELECT.format(table="fisheriescape_nafoarea", column="nafo_area"),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"grid_id": grid_id, "distance": distance})
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+ZONAL_STATISTICS_SQL = """
+    WITH scores AS (
+        SELECT s.hexagon_id, w.week_number, SUM(s.fs_score)::float8 AS fs_score
+        FROM fisheriescape_score s
+                 JOIN fisheriescape_species sp ON sp.id = s.species_id
+                 JOIN fisheriescape_week w ON w.id = s.week_id
+        WHERE sp.english_name = ANY(%(species)s)
+          AND w.week_number BETWEEN %(week_from)s AND %(week_to)s
+          AND s.fs_score IS NOT NULL
+        GROUP BY s.hexagon_id, w.week_number
+    )
+    SELECT COALESCE(json_agg(stats ORDER BY stats.layer_id, stats.name), '[]'::json)::text
+    FROM (
+        SELECT a.id AS pk,
+               a.name,
+               a.layer_id,
+               COUNT(DISTINCT o.hexagon_id) AS hexagon_count,
+               SUM(scores.fs_score) AS sum,
+               AVG(scores.fs_score) AS mean,
+               MAX(scores.fs_score) AS max,
+               SUM(scores.fs_score * o.overlap_fraction) / NULLIF(SUM(o.overlap_fraction), 0) AS weighted_mean
+        FROM {table} a
+                 JOIN fisheriescape_hexagonareaoverlap o ON o.{layer}_id = a.id
+                 JOIN scores ON scores.hexagon_id = o.hexagon_id
+        {where}
+        GROUP BY a.id
+    ) stats
+"""
+
+
+def get_zonal_statistics(species, week_from=1, week_to=SEASON_WEEKS, layer="fishery_area", layer_id=None, name=None):
+    """
+    Aggregate the fs_scores (summed when there are several species) of the hexagons overlapping each FisheryArea or
+    NAFOArea, over a range of weeks: their sum, mean and max over every hexagon and week, and their mean weighted by
+    the fraction of each hexagon inside the area (the hexagons of the grid all have the same area). The overlaps come
+    from the precomputed HexagonAreaOverlap rows, so no geometry is touched.
+    :param species: list of species english names
+    :param week_from: first week number of the range
+    :param week_to: last week number of the range
+    :param layer: "fishery_area" or "nafo_area"
+    :param layer_id: only the areas of this layer_id (e.g. "Lobster")
+    :param name: only the areas of this name (e.g. "23")
+    :return: the JSON encoded array of the statistics of each area as a str
+    """
+    table, region = AREA_LAYERS[layer]
+    params = {"species": list(species), "week_from": week_from, "week_to": week_to}
+    where = []
+    if layer_id is not None:
+        where.append("a.layer_id = %(layer_id)s")
+        params["layer_id"] = layer_id
+    if name is not None:
+        where.append("a.name = %(name)s")
+        params["name"] = name
+    sql = ZONAL_STATISTICS_SQL.format(table=table, layer=layer, where=f"WHERE {' AND '.join(where)}" if where else "")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return row[0]
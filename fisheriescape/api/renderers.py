@@ -0,0 +1,56 @@
+import json
+import struct
+import sys
+
+from rest_framework.renderers import BaseRenderer
+
+DTYPES = {
+    "i": "<i4",
+    "f": "<f4",
+}
+
+
+class ScoreColumnsRenderer(BaseRenderer):
+    """
+    Render score columns (python arrays, see queries.get_score_columns) as a compact binary payload:
+        - 4 bytes: length of the JSON header, unsigned little-endian int
+        - the JSON header, padded with spaces so that the column buffers start on an 8 byte boundary
+        - the raw column buffers, one after the other, little-endian int32 / float32
+
+    The header describes each column with its name, dtype, offset (from the start of the buffers) and length, e.g. in
+    numpy: np.frombuffer(payload, dtype=column["dtype"], count=column["length"], offset=buffers_start + column["offset"])
+    """
+    media_type = 'application/octet-stream'
+    format = 'binary'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # errors (e.g. a validation error) have no columns, they are rendered as plain JSON
+        if "columns" not in data:
+            return json.dumps(data).encode('utf-8')
+
+        header = {key: value for key, value in data.items() if key != "columns"}
+        header["columns"] = []
+        buffers = []
+        offset = 0
+        for name, column in data["columns"].items():
+            if sys.byteorder != "little":
+                column = column.__copy__()
+                column.byteswap()
+            buffer = column.tobytes()
+            header["columns"].append({
+                "name": name,
+                "dtype": DTYPES[column.typecode],
+                "offset": offset,
+                "length": len(column),
+            })
+            buffers.append(buffer)
+            offset += len(buffer)
+
+        encoded_header = json.dumps(header).encode('utf-8')
+        padding = -(4 + len(encoded_header)) % 8
+        encoded_header += b" " * padding
+        return b"".join([struct.pack("<I", len(encoded_header)), encoded_header, *buffers])
@@ -8,7 +8,8 @@ from rest_framework_gis.serializers import GeoFeatureModelSerializer, GeometrySe
 from django.db import models
 from drf_extra_fields.geo_fields import PointField
 
-from fisheriescape.models import Score, Hexagon, Species, Week, VulnerableSpecies, VulnerableSpeciesSpot
+from fisheriescape.models import Score, Hexagon, Species, Week, VulnerableSpecies, VulnerableSpeciesSpot, \
+    SpeciesScoreStats
 
 
 ## doesn't work with leaflet implementation as yet
@@ -60,104 +61,105 @@ class HexagonSerializer(GeoFeatureModelSerializer):
 #
 ## BUT need GeoFeatureModelSerializer to use getJSON in map3.js---is there another way to import api endpoint into .js file?
 
+def get_season_score_stats(species_names):
+    """
+    Return the max fs_score summed over the given species and, for a single species, its precomputed decile breaks.
+    :param species_names: iterable of species english names
+    :return: a (max_fs_score, fs_score_breaks) tuple
+    """
+    species_names = set(species_names)
+    season_stats = {
+        stats.species.english_name: stats for stats in
+        SpeciesScoreStats.objects.filter(week__isnull=True, species__english_name__in=species_names)
+        .select_related('species')
+    }
+    max_fs_score = 0
+    for species in species_names:
+        stats = season_stats.get(species)
+        if stats:
+            species_max_fs_score = stats.max_fs_score
+        else:
+            # stats have not been refreshed since these scores were loaded
+            species_max_fs_score = Score.objects.filter(species__english_name=species).aggregate(
+                models.Max('fs_score')).get('fs_score__max')
+        max_fs_score += species_max_fs_score or 0
+
+    # quantile breaks only make sense for a single species, sums of several species have no precomputed breaks
+    fs_score_breaks = None
+    if len(species_names) == 1 and season_stats:
+        fs_score_breaks = list(season_stats.values())[0].quantile_breaks
+    return max_fs_score, fs_score_breaks
+
+
 class CustomGeoFeatureModelListSerializer(ListSerializer):
     @property
     def data(self):
         return super(ListSerializer, self).data
 
+    def get_species_names(self, data):
+        """
+        Return the english names of the species in this collection, from the request if it was filtered by species
+        and otherwise from the queryset itself
+        """
+        request = self.context.get('request')
+        species_names = request.query_params.getlist('species') if request else []
+        if not species_names and isinstance(data, models.QuerySet) and data.model is Score:
+            species_names = data.order_by().values_list('species__english_name', flat=True).distinct()
+        return set(species_names)
+
     def to_representation(self, data):
         """
         Add GeoJSON compatible formatting to a serialized queryset list
         """
         max_fs_score = 0
+        fs_score_breaks = None
         if data:
-            if isinstance(data[0], Score):
-                # Single species
-                species_list = {score.species for score in data.all()}
-                max_fs_score = sum(
-                    [Score.objects.filter(species=species).aggregate(models.Max('fs_score')).get('fs_score__max') for
-                     species in species_list])
-            else:
-                # Combined data from multiple species
-                species_names = set()
-                for score in data:
-                    species_names.update(score.get('species').split(','))
-
-                for species in species_names:
-                    species_max_fs_score = Score.objects.filter(species__english_name=species).aggregate(
-                        models.Max('fs_score')).get('fs_score__max')
-                    max_fs_score += species_max_fs_score
+            max_fs_score, fs_score_breaks = get_season_score_stats(self.get_species_names(data))
 
         return OrderedDict(
             (
                 ("type", "FeatureCollection"),
                 ("max_fs_score", max_fs_score),
+                ("fs_score_breaks", fs_score_breaks),
                 ("features", super().to_representation(data)),
             )
         )
 
 
-class ScoreFeatureSerializer(GeoFeatureModelSerializer):
-    """A class to serialize hex polygons as GeoJSON compatible data"""
+def round_coordinates(coordinates, precision):
+    """Round the (nested) coordinates of a GeoJSON geometry to a number of decimals"""
+    if isinstance(coordinates, (list, tuple)):
+        return [round_coordinates(coordinate, precision) for coordinate in coordinates]
+    return round(coordinates, precision)
 
-    hexagon = GeometrySerializerMethodField()
-    species = StringRelatedField()
-    week = StringRelatedField()
-    grid_id = SerializerMethodField()
 
-    def get_hexagon(self, obj):
-        return obj.hexagon.polygon
-
-    def get_grid_id(self, obj):
-        return obj.hexagon.grid_id
-
-    class Meta:
-        model = Score
-        geo_field = 'hexagon'
-        fields = "__all__"
-
-    # Override base method to use our custom GeoFeatureModelListSerializer
-    @classmethod
-    def many_init(cls, *args, **kwargs):
-        child_serializer = cls(*args, **kwargs)
-        list_kwargs = {'child': child_serializer}
-        list_kwargs.update(
-            {
-                key: value
-                for key, value in kwargs.items()
-                if key in LIST_SERIALIZER_KWARGS
-            }
-        )
-        meta = getattr(cls, 'Meta', None)
-        list_serializer_class = getattr(
-            meta, 'list_serializer_class', CustomGeoFeatureModelListSerializer
-        )
-        return list_serializer_class(*args, **list_kwargs)
-
-
-class ScoreFeatureCombinedSerializer(GeoFeatureModelSerializer):
-    """A class to serialize hex polygons as GeoJSON compatible data"""
+class ScoreFeatureSerializer(GeoFeatureModelSerializer):
+    """
+    A class to serialize hex polygons as GeoJSON compatible data. The coordinates are rounded to the `precision`
+    number of decimals of the serializer context, if any.
+    """
 
     hexagon = GeometrySerializerMethodField()
     species = StringRelatedField()
     week = StringRelatedField()
     grid_id = SerializerMethodField()
-    species_count = SerializerMethodField()
 
     def get_hexagon(self, obj):
-        hexagon_id = obj.get('hexagon')
-        return Hexagon.objects.get(id=hexagon_id).polygon
+        # the view annotates a simplified polygon when a lower resolution is requested
+        return getattr(obj, 'simplified_polygon', None) or obj.hexagon.polygon
 
     def get_grid_id(self, obj):
-        hexagon_id = obj.get('hexagon')
-        return Hexagon.objects.get(id=hexagon_id).grid_id
+        return obj.hexagon.grid_id
 
-    def get_species_count(self, obj):
-        return obj.get('species_count')
+    def to_representation(self, instance):
+        feature = super().to_representation(instance)
+        precision = self.context.get('precision')
+        if precision is not None and feature.get('geometry'):
+            feature['geometry']['coordinates'] = round_coordinates(feature['geometry']['coordinates'], precision)
+        return feature
 
     class Meta:
         model = Score
-        id_field = None
         geo_field = 'hexagon'
         fields = "__all__"
 
@@ -12,7 +12,15 @@ urlpatterns = [
 
     path("fisheriescape/scores-feature/", views.ScoreFeatureView.as_view(), name="scores-feature"),
     path("fisheriescape/scores-feature-combined/", views.ScoreFeatureCombinedView.as_view(), name="scores-feature-combined"),
+    path("fisheriescape/scores-tiles/<int:z>/<int:x>/<int:y>.mvt", views.ScoreTileView.as_view(), name="scores-tiles"),
+    path("fisheriescape/hexagon-grid/", views.HexagonGridView.as_view(), name="hexagon-grid"),
+    path("fisheriescape/scores-values/", views.ScoreValuesView.as_view(), name="scores-values"),
+    path("fisheriescape/scores-timeseries/", views.ScoreTimeseriesView.as_view(), name="scores-timeseries"),
+    path("fisheriescape/map-area-layers/", views.MapAreaLayersView.as_view(), name="map-area-layers"),
+    path("fisheriescape/hexagon/<str:grid_id>/profile/", views.HexagonProfileView.as_view(), name="hexagon-profile"),
+    path("fisheriescape/zonal-statistics/", views.ZonalStatisticsView.as_view(), name="zonal-statistics"),
     path("fisheriescape/vulnerable-species-spots/", views.VulnerableSpeciesSpotsView.as_view(), name="vulnerable-species-spots"),
+    path("fisheriescape/import-jobs/<int:pk>/", views.ImportJobView.as_view(), name="import-job"),
     # lookups
     path("fisheriescape/vulnerable-species/", views.VulnerableSpeciesView.as_view(), name="vulnerable-species"),
     path("fisheriescape/species/", views.SpeciesListAPIView.as_view(), name="fisheriescape-species-list"),
@@ -1,15 +1,30 @@
-from hashlib import md5
+import json
+import math
 
-from django.contrib.postgres.aggregates import StringAgg
-from django.core.checks import caches
-from django.db.models import Sum, Count
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, get_conditional_response, set_response_etag
+from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.generics import ListAPIView
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
 from .serializers import ScoreFeatureSerializer, SpeciesSerializer, WeekSerializer, VulnerableSpeciesSerializer, \
-    VulnerableSpeciesSpotsSerializer, ScoreFeatureCombinedSerializer
+    VulnerableSpeciesSpotsSerializer, get_season_score_stats
+from .payloads import get_score_feature_queryset, get_score_feature_payload, get_combined_score_feature_payload, \
+    get_map_area_layers_payload, get_score_timeseries_payload, stream_score_feature_collection, stream_json_array
+from .queries import get_score_tile, get_hexagon_grid_version, get_hexagon_grid, get_score_values, get_score_columns, \
+    get_score_timeseries_columns, get_hexagon_profile, get_zonal_statistics, AREA_LAYERS, SEASON_WEEKS
+from .renderers import ScoreColumnsRenderer
 from .. import models
-from fisheriescape.views import FisheriescapeAccessRequired
+from fisheriescape.caching import get_score_cache, get_cache_key, decompress_payload, get_compressed_response, \
+    get_response_encoding, get_response_etag, get_data_modified, get_not_modified_response, set_validators, \
+    count_combined_species_request, get_streaming_response
+from fisheriescape.cube import get_score_cube
+from fisheriescape.utils import get_geometry_params, get_spatial_filter_params, get_week_param
+from fisheriescape.views import FisheriescapeAccessRequired, FisheriescapeAdminAccessRequired
 
 
 # class EntryCSVAPIView(ListAPIView):
@@ -81,76 +96,318 @@ from fisheriescape.views import FisheriescapeAccessRequired
 class ScoreFeatureView(FisheriescapeAccessRequired, ListAPIView):
     queryset = models.Score.objects.all()
     serializer_class = ScoreFeatureSerializer
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ScoreColumnsRenderer]
+
+    def list_columns(self):
+        """
+        Binary columnar version of the scores (`format=binary`), for the species and weeks requested. Several species
+        and weeks can be given, and no geometry is included: hexagons are identified by their id.
+        """
+        species = self.request.query_params.getlist('species')
+        weeks = self.request.query_params.getlist('week')
+        if not all(week.isdigit() for week in weeks):
+            raise ValidationError("The week parameter must be a week number.")
+        return Response({
+            "species": dict(models.Species.objects.values_list('id', 'english_name')),
+            "columns": get_score_columns(species=species, weeks=weeks),
+        })
 
     # Cache the results
     def list(self, request, *args, **kwargs):
-        cache = caches.caches['default']
+        if request.accepted_renderer.format == ScoreColumnsRenderer.format:
+            return self.list_columns()
+
         species = self.request.query_params.get('species')
-        week = self.request.query_params.get('week')
-        cache_key = f"ScoreFeatureViewSet:{species}_{week}".encode('utf-8')
-        hashed_cache_key = md5(cache_key).hexdigest()
-        cached_results = cache.get(hashed_cache_key)
-        if cached_results:
-            return Response(cached_results)
-        else:
-            queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
-            cache.set(hashed_cache_key, serializer.data)
-            return Response(serializer.data)
+        week = get_week_param(self.request.query_params)
+        resolution, precision = get_geometry_params(self.request.query_params)
+        spatial_filter = get_spatial_filter_params(self.request.query_params, self.request.data)
+        cache_key = get_cache_key("scores-feature", species=species, week=week, resolution=resolution,
+                                  precision=precision, **spatial_filter)
+        stream = self.request.query_params.get('stream') == 'true' and \
+            request.accepted_renderer.format == JSONRenderer.format
+        etag = get_response_etag(cache_key, request.accepted_renderer.format, get_response_encoding(request),
+                                 "stream" if stream else "")
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified, vary=("Accept-Encoding",))
+        if not_modified is not None:
+            return not_modified
+
+        if stream:
+            # e.g. a whole season: encoded as it is read instead of rendered and cached in one piece
+            content = stream_score_feature_collection(species=species, week=week, resolution=resolution,
+                                                      precision=precision, spatial_filter=spatial_filter)
+            return set_validators(get_streaming_response(request, content), etag, last_modified)
+
+        payload = get_score_feature_payload(species=species, week=week, resolution=resolution, precision=precision,
+                                            spatial_filter=spatial_filter)
+        stale = payload["cache_key"] != cache_key
+        if request.accepted_renderer.format != JSONRenderer.format:
+            # e.g. the browsable api
+            return set_validators(Response(json.loads(decompress_payload(payload))), etag, last_modified, stale)
+        return set_validators(get_compressed_response(request, payload), etag, last_modified, stale)
 
     def get_queryset(self):
-        queryset = self.queryset.prefetch_related('week').prefetch_related('species').prefetch_related("hexagon")
-
         species = self.request.query_params.get('species')
-        week = self.request.query_params.get('week')
+        week = get_week_param(self.request.query_params)
+        resolution, precision = get_geometry_params(self.request.query_params)
+        spatial_filter = get_spatial_filter_params(self.request.query_params, self.request.data)
+        return get_score_feature_queryset(species=species, week=week, resolution=resolution,
+                                          spatial_filter=spatial_filter)
 
-        if species:
-            queryset = queryset.filter(species__english_name=species)
-        if week is not None:
-            queryset = queryset.filter(week__week_number=week)
+    def get_serializer_context(self):
+        resolution, precision = get_geometry_params(self.request.query_params)
+        return {**super().get_serializer_context(), "precision": precision}
 
-        return queryset
+    def post(self, request, *args, **kwargs):
+        """The same scores, only within the WKT `polygon` of the body"""
+        return self.list(request, *args, **kwargs)
 
 
 class ScoreFeatureCombinedView(FisheriescapeAccessRequired, ListAPIView):
+    """
+    Scores summed per hexagon over several species. The FeatureCollection is assembled by PostGIS and returned as is,
+    without going through the ORM or a serializer.
+    """
     queryset = models.Score.objects.all()
-    serializer_class = ScoreFeatureCombinedSerializer
 
     # Cache the results
     def list(self, request, *args, **kwargs):
-        cache = caches.caches['default']
-        species = self.request.query_params.get('species')
-        week = self.request.query_params.get('week')
-        cache_key = f"ScoreFeatureViewSet:{species}_{week}".encode('utf-8')
-        hashed_cache_key = md5(cache_key).hexdigest()
-        cached_results = cache.get(hashed_cache_key)
-        if cached_results:
-            return Response(cached_results)
+        species = sorted(self.request.query_params.getlist('species'))
+        week = get_week_param(self.request.query_params)
+        resolution, precision = get_geometry_params(self.request.query_params)
+        spatial_filter = get_spatial_filter_params(self.request.query_params, self.request.data)
+        cache_key = get_cache_key("scores-feature-combined", species=species, week=week, resolution=resolution,
+                                  precision=precision, **spatial_filter)
+        etag = get_response_etag(cache_key, get_response_encoding(request))
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified, vary=("Accept-Encoding",))
+        if not_modified is not None:
+            return not_modified
+
+        if len(species) > 1:
+            # the most requested species sets are kept warm, see tasks.warm_score_cache
+            count_combined_species_request(species)
+        payload = get_combined_score_feature_payload(species=species, week=week, resolution=resolution,
+                                                     precision=precision, spatial_filter=spatial_filter)
+        stale = payload["cache_key"] != cache_key
+        return set_validators(get_compressed_response(request, payload), etag, last_modified, stale)
+
+    def post(self, request, *args, **kwargs):
+        """The same scores, only within the WKT `polygon` of the body"""
+        return self.list(request, *args, **kwargs)
+
+
+class ScoreTileView(FisheriescapeAccessRequired, APIView):
+    """Serve the hexagon scores as Mapbox Vector Tiles so the map only fetches what is in view"""
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        species = sorted(self.request.query_params.getlist('species'))
+        week = get_week_param(self.request.query_params)
+        if not species or week is None:
+            raise ValidationError("Both species and week parameters are required.")
+        if not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise ValidationError("Tile coordinates are out of range for this zoom level.")
+
+        cache = get_score_cache()
+        cache_key = get_cache_key("scores-tiles", species=species, week=week, z=z, x=x, y=y)
+        tile = cache.get(cache_key)
+        if tile is None:
+            tile = get_score_tile(z=z, x=x, y=y, species=species, week=week)
+            cache.set(cache_key, tile)
+
+        return HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+
+
+class HexagonGridView(FisheriescapeAccessRequired, APIView):
+    """
+    The hexagon geometries, once, with a stable integer index (the feature id) per hexagon. When requested with the
+    current version as `v`, the response can be cached by the browser for good since a new grid gets a new version.
+    Accepts the `zoom` or `tolerance` and `precision` parameters to get simplified polygons.
+    """
+
+    def get(self, request, *args, **kwargs):
+        cache = get_score_cache()
+        version = get_hexagon_grid_version()
+        resolution, precision = get_geometry_params(self.request.query_params)
+        cache_key = get_cache_key("hexagon-grid", version=version, resolution=resolution, precision=precision)
+        grid = cache.get(cache_key)
+        if grid is None:
+            grid = get_hexagon_grid(version=version, resolution=resolution, precision=precision)
+            cache.set(cache_key, grid)
+
+        response = HttpResponse(grid, content_type="application/json")
+        if self.request.query_params.get('v') == version:
+            patch_cache_control(response, private=True, max_age=60 * 60 * 24 * 365, immutable=True)
         else:
-            queryset = self.filter_queryset(self.get_queryset())
-            serializer = self.get_serializer(queryset, many=True)
-            cache.set(hashed_cache_key, serializer.data)
-            return Response(serializer.data)
-
-    def get_queryset(self):
-        queryset = self.queryset.prefetch_related('week').prefetch_related('species').prefetch_related("hexagon")
-
-        species = self.request.query_params.getlist('species')
-        week = self.request.query_params.get('week')
-
-        if week is not None:
-            queryset = queryset.filter(week__week_number=week)
-
-        if species:
-            queryset = queryset.filter(species__english_name__in=species).values('hexagon', 'week').annotate(
-                fs_score=Sum("fs_score"),
-                species=StringAgg(
-                    'species__english_name', delimiter=','),
-                species_count=(Count("id")),
-                id=Sum('id')
-            ).order_by()
-
-        return queryset
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class ScoreValuesView(FisheriescapeAccessRequired, APIView):
+    """
+    Only the fs_scores of a species/week, to be drawn on the grid from HexagonGridView. Use `format=dense` for one
+    value per hexagon in grid order, otherwise [hexagon index, fs_score] pairs are returned.
+    """
+
+    def get(self, request, *args, **kwargs):
+        species = sorted(self.request.query_params.getlist('species'))
+        week = get_week_param(self.request.query_params)
+        dense = self.request.query_params.get('format') == 'dense'
+        if not species or week is None:
+            raise ValidationError("Both species and week parameters are required.")
+
+        cache = get_score_cache()
+        version = get_hexagon_grid_version()
+        cache_key = get_cache_key("scores-values", version=version, species=species, week=week, dense=dense)
+        payload = cache.get(cache_key)
+        if payload is None:
+            max_fs_score, fs_score_breaks = get_season_score_stats(species)
+            header = json.dumps({
+                "version": version,
+                "format": "dense" if dense else "pairs",
+                "max_fs_score": max_fs_score,
+                "fs_score_breaks": fs_score_breaks,
+            })
+            cube = get_score_cube()
+            if cube is not None:
+                values = json.dumps(self.get_cube_values(cube, species, week, dense))
+            else:
+                values = get_score_values(species=species, week=week, dense=dense)
+            # splice the values array (already JSON encoded by the database) into the header object
+            payload = f'{header[:-1]}, "values": {values}}}'.encode('utf-8')
+            cache.set(cache_key, payload)
+
+        return HttpResponse(payload, content_type="application/json")
+
+    @staticmethod
+    def get_cube_values(cube, species, week, dense):
+        """The values of get_score_values, summed from the score cube instead of the database"""
+        values = [None if math.isnan(value) else round(value, 4) for value in cube.get_week_values(species, week)]
+        if dense:
+            return values
+        return [[hexagon_id, value] for hexagon_id, value in zip(cube.hexagon_ids, values) if value is not None]
+
+
+class ScoreTimeseriesView(FisheriescapeAccessRequired, APIView):
+    """
+    The fs_scores of every week of the season of a species (summed when there are several), per hexagon, so that the
+    weeks can be animated on the client after a single download. Returns [hexagon id, [53 weekly fs_scores]] series,
+    or with `format=binary` the hexagon ids and a flat float32 array of 53 weekly values per hexagon (NaN when there
+    is no score).
+    """
+    renderer_classes = [JSONRenderer, ScoreColumnsRenderer]
+
+    def get(self, request, *args, **kwargs):
+        species = sorted(self.request.query_params.getlist('species'))
+        if not species:
+            raise ValidationError("The species parameter is required.")
+
+        if request.accepted_renderer.format == ScoreColumnsRenderer.format:
+            cube = get_score_cube()
+            max_fs_score, fs_score_breaks = get_season_score_stats(species)
+            return Response({
+                "weeks": SEASON_WEEKS,
+                "max_fs_score": max_fs_score,
+                "fs_score_breaks": fs_score_breaks,
+                "columns": cube.get_timeseries_columns(species) if cube else get_score_timeseries_columns(species),
+            })
+
+        cache_key = get_cache_key("scores-timeseries", species=species)
+        etag = get_response_etag(cache_key, get_response_encoding(request))
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified, vary=("Accept-Encoding",))
+        if not_modified is not None:
+            return not_modified
+
+        payload = get_score_timeseries_payload(species)
+        stale = payload["cache_key"] != cache_key
+        return set_validators(get_compressed_response(request, payload), etag, last_modified, stale)
+
+
+class MapAreaLayersView(FisheriescapeAccessRequired, APIView):
+    """
+    The fishery and NAFO area layers of the maps, as one JSON object of a FeatureCollection per layer. Accepts the
+    `zoom` or `tolerance` and `precision` parameters to get simplified polygons.
+    """
+
+    def get(self, request, *args, **kwargs):
+        resolution, precision = get_geometry_params(self.request.query_params)
+        cache_key = get_cache_key("map-area-layers", resolution=resolution, precision=precision)
+        etag = get_response_etag(cache_key, get_response_encoding(request))
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified, vary=("Accept-Encoding",))
+        if not_modified is not None:
+            return not_modified
+
+        payload = get_map_area_layers_payload(resolution=resolution, precision=precision)
+        stale = payload["cache_key"] != cache_key
+        return set_validators(get_compressed_response(request, payload), etag, last_modified, stale)
+
+
+class HexagonProfileView(FisheriescapeAccessRequired, APIView):
+    """
+    Everything about one hexagon, for the map popups: the fs/site/ceu scores of every species and week, the fishery
+    and NAFO areas it overlaps and the vulnerable species spots around it, see queries.get_hexagon_profile.
+    """
+
+    def get(self, request, grid_id, *args, **kwargs):
+        cache_key = get_cache_key("hexagon-profile", grid_id=grid_id)
+        etag = get_response_etag(cache_key)
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache = get_score_cache()
+        profile = cache.get(cache_key)
+        if profile is None:
+            profile = get_hexagon_profile(grid_id)
+            if profile is None:
+                raise NotFound(f"There is no hexagon {grid_id}.")
+            profile = profile.encode('utf-8')
+            cache.set(cache_key, profile)
+
+        return set_validators(HttpResponse(profile, content_type="application/json"), etag, last_modified)
+
+
+class ZonalStatisticsView(FisheriescapeAccessRequired, APIView):
+    """
+    The fs_score statistics of a species set (summed per hexagon) inside each fishery or NAFO area, over a range of
+    weeks, see queries.get_zonal_statistics. Use `layer` (fishery_area or nafo_area), `layer_id` and `name` to pick
+    the areas, and `week_from`/`week_to` for the weeks (the whole season by default).
+    """
+
+    def get(self, request, *args, **kwargs):
+        species = sorted(self.request.query_params.getlist('species'))
+        layer = self.request.query_params.get('layer', "fishery_area")
+        layer_id = self.request.query_params.get('layer_id')
+        name = self.request.query_params.get('name')
+        if not species:
+            raise ValidationError("The species parameter is required.")
+        if layer not in AREA_LAYERS:
+            raise ValidationError(f"The layer parameter must be one of {', '.join(AREA_LAYERS)}.")
+        try:
+            week_from = int(self.request.query_params.get('week_from', 1))
+            week_to = int(self.request.query_params.get('week_to', SEASON_WEEKS))
+        except ValueError:
+            raise ValidationError("The week_from and week_to parameters must be week numbers.")
+
+        cache_key = get_cache_key("zonal-statistics", species=species, week_from=week_from, week_to=week_to,
+                                  layer=layer, layer_id=layer_id, name=name)
+        etag = get_response_etag(cache_key)
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        cache = get_score_cache()
+        statistics = cache.get(cache_key)
+        if statistics is None:
+            statistics = get_zonal_statistics(species, week_from=week_from, week_to=week_to, layer=layer,
+                                              layer_id=layer_id, name=name).encode('utf-8')
+            cache.set(cache_key, statistics)
+
+        return set_validators(HttpResponse(statistics, content_type="application/json"), etag, last_modified)
 
 
 class VulnerableSpeciesSpotsView(FisheriescapeAccessRequired, ListAPIView):
@@ -159,19 +416,34 @@ class VulnerableSpeciesSpotsView(FisheriescapeAccessRequired, ListAPIView):
 
     # Cache the results
     def list(self, request, *args, **kwargs):
-        cache = caches.caches['default']
+        cache = get_score_cache()
         vulnerable_species = self.request.query_params.get('vulnerable_species')
         week = self.request.query_params.get('week')
-        cache_key = f"VulnerableSpeciesSpotsView:{vulnerable_species}_{week}".encode('utf-8')
-        hashed_cache_key = md5(cache_key).hexdigest()
-        cached_results = cache.get(hashed_cache_key)
+        cache_key = get_cache_key("vulnerable-species-spots",
+                                  vulnerable_species=vulnerable_species.split(',') if vulnerable_species else None,
+                                  week=week)
+        stream = self.request.query_params.get('stream') == 'true' and \
+            request.accepted_renderer.format == JSONRenderer.format
+        etag = get_response_etag(cache_key, request.accepted_renderer.format, "stream" if stream else "")
+        last_modified = get_data_modified()
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        if stream:
+            queryset = self.get_queryset().prefetch_related(None).select_related('week', 'vulnerable_species') \
+                .order_by('id')
+            content = stream_json_array(queryset, self.get_serializer())
+            return set_validators(get_streaming_response(request, content), etag, last_modified)
+
+        cached_results = cache.get(cache_key)
         if cached_results:
-            return Response(cached_results)
+            return set_validators(Response(cached_results), etag, last_modified)
         else:
             queryset = self.filter_queryset(self.get_queryset())
             serializer = self.get_serializer(queryset, many=True)
-            cache.set(hashed_cache_key, serializer.data)
-            return Response(serializer.data)
+            cache.set(cache_key, serializer.data)
+            return set_validators(Response(serializer.data), etag, last_modified)
 
     def get_queryset(self):
         queryset = self.queryset.prefetch_related('week').prefetch_related('vulnerable_species')
@@ -194,16 +466,43 @@ class VulnerableSpeciesSpotsView(FisheriescapeAccessRequired, ListAPIView):
 # LOOKUPS
 ##########
 
-class SpeciesListAPIView(ListAPIView):
+class ImportJobView(FisheriescapeAdminAccessRequired, APIView):
+    """The progress of an import job (see models.ImportJob.get_progress), polled by the import pages"""
+
+    def get(self, request, pk, *args, **kwargs):
+        job = get_object_or_404(models.ImportJob, pk=pk)
+        response = Response(job.get_progress())
+        patch_cache_control(response, no_store=True)
+        return response
+
+
+class ConditionalLookupMixin:
+    """
+    The lookups hardly ever change: let the browser keep them for a day, then revalidate them with an ETag of their
+    content (a 304 costs the query but not the transfer).
+    """
+    lookup_max_age = 60 * 60 * 24
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        response.render()
+        set_response_etag(response)
+        patch_cache_control(response, private=True, max_age=self.lookup_max_age)
+        return get_conditional_response(request, etag=response["ETag"], response=response)
+
+
+class SpeciesListAPIView(ConditionalLookupMixin, ListAPIView):
     queryset = models.Species.objects.all()
     serializer_class = SpeciesSerializer
 
 
-class VulnerableSpeciesView(FisheriescapeAccessRequired, ListAPIView):
+class VulnerableSpeciesView(FisheriescapeAccessRequired, ConditionalLookupMixin, ListAPIView):
     queryset = models.VulnerableSpecies.objects.all()
     serializer_class = VulnerableSpeciesSerializer
 
 
-class WeekListAPIView(ListAPIView):
+class WeekListAPIView(ConditionalLookupMixin, ListAPIView):
     queryset = models.Week.objects.all()
     serializer_class = WeekSerializer
@@ -0,0 +1,319 @@
+import gzip
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.text import compress_sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# All the cached api payloads are keyed on this data version. Bumping it (on every score, spot or polygon import)
+# retires every cached payload at once: the old entries are simply never read again and expire on their own.
+DATA_VERSION_KEY = "fisheriescape:data_version"
+# bumped on score imports only, along with the data version: what is built from the scores alone (the score cube) is
+# keyed on it, so that spot and polygon imports leave it valid
+SCORE_VERSION_KEY = "fisheriescape:score_version"
+# the combined species sets requested and how many times (see count_combined_species_request)
+COMBINED_SPECIES_KEY = "fisheriescape:combined_species"
+MAX_COMBINED_SPECIES_SETS = 100
+SCORE_CACHE_ALIAS = "default"
+
+# single-flight: seconds a worker holds the lock on a key it computes, and seconds the others wait for its result
+LOCK_TIMEOUT = 60
+LOCK_WAIT = 30
+LOCK_POLL_INTERVAL = 0.1
+# seconds the latest payload of a key is kept, to be served while the one of a new data version is computed
+STALE_TIMEOUT = 60 * 60 * 24
+# payloads of a new data version computed in the background at the same time by a process, and at most waiting to be
+# computed; past that, the stale payload is served without being revalidated and a later request revalidates it
+REVALIDATION_WORKERS = 2
+MAX_PENDING_REVALIDATIONS = 20
+
+_revalidation_executor = ThreadPoolExecutor(max_workers=REVALIDATION_WORKERS, thread_name_prefix="revalidate")
+_pending_revalidations = threading.BoundedSemaphore(MAX_PENDING_REVALIDATIONS)
+
+
+def get_score_cache():
+    return caches[SCORE_CACHE_ALIAS]
+
+
+def get_version(key):
+    """Return the current version of a version key, starting a new one if the cache lost it"""
+    # a time based starting value so a lost version never brings back entries of an older one
+    return get_score_cache().get_or_set(key, lambda: int(time.time()), timeout=None)
+
+
+def bump_version(key):
+    cache = get_score_cache()
+    # the version stays a timestamp, so that it can be used as the Last-Modified time of the payloads
+    version = cache.get(key, 0)
+    cache.set(key, max(int(time.time()), version + 1), timeout=None)
+
+
+def get_data_version():
+    return get_version(DATA_VERSION_KEY)
+
+
+def bump_data_version():
+    """Start a new data version. To be called whenever spots or polygons are loaded, see bump_score_version for scores"""
+    bump_version(DATA_VERSION_KEY)
+
+
+def get_score_version():
+    return get_version(SCORE_VERSION_KEY)
+
+
+def bump_score_version():
+    """Start a new score version and a new data version. To be called whenever scores are loaded"""
+    bump_version(SCORE_VERSION_KEY)
+    bump_version(DATA_VERSION_KEY)
+
+
+def get_data_modified():
+    """The time the current data version was started, as a timestamp"""
+    return min(get_data_version(), int(time.time()))
+
+
+def get_cache_key(namespace, **params):
+    """
+    Build a cache key that is unique to an endpoint (namespace), the current data version and the parameters of the
+    request. Multi-valued parameters are sorted, so ?species=a&species=b and ?species=b&species=a share an entry.
+    Tuples are ordered values (e.g. the coordinates of a bbox) and keep their order.
+    :param namespace: name of the endpoint
+    :param params: the parameters the payload depends on
+    """
+    canonical_params = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, tuple):
+            value = ",".join(str(item) for item in value)
+        elif isinstance(value, (list, set)):
+            value = ",".join(sorted(str(item) for item in value))
+        canonical_params.append(f"{name}={value}")
+    hashed_params = md5("&".join(canonical_params).encode('utf-8')).hexdigest()
+    return f"fisheriescape:{namespace}:{get_data_version()}:{hashed_params}"
+
+
+def get_stale_key(cache_key):
+    """The key of the latest payload cached under cache_key, whatever its data version"""
+    prefix, namespace, version, hashed_params = cache_key.split(":")
+    return f"{prefix}:{namespace}:stale:{hashed_params}"
+
+
+def _compute_and_set(cache_key, compute, lock_key=None):
+    cache = get_score_cache()
+    try:
+        value = compute()
+        cache.set(cache_key, value)
+        cache.set(get_stale_key(cache_key), value, timeout=STALE_TIMEOUT)
+        return value
+    finally:
+        if lock_key:
+            cache.delete(lock_key)
+
+
+def _revalidate(cache_key, compute, lock_key):
+    try:
+        _compute_and_set(cache_key, compute, lock_key)
+    finally:
+        _pending_revalidations.release()
+        # this thread does not go through django's request cycle, which would close its connection
+        connections.close_all()
+
+
+def get_or_compute(cache_key, compute, refresh=False, serve_stale=True):
+    """
+    Get a payload from the cache, computing and caching it on a miss. Only one worker computes a given key at a time:
+        - the first one to miss takes a lock on the key and computes it
+        - the others serve the payload of the previous data version if there is one (stale-while-revalidate),
+          otherwise they wait for the first one to cache its result
+    The first worker itself serves the previous payload, when there is one, and has the new one computed by the
+    revalidation threads of the process (see REVALIDATION_WORKERS), unless the FISHERIESCAPE_STALE_WHILE_REVALIDATE
+    setting is False. Stale payloads are the ones of another key than cache_key, see compress_payload.
+    :param cache_key: key from get_cache_key
+    :param compute: function returning the payload, never None
+    :param refresh: compute it again even if it is cached
+    :param serve_stale: False to never get a stale payload: the payload is computed here, or waited for, on a miss.
+    For the callers that compute payloads to have them cached, such as tasks.warm_score_cache.
+    """
+    cache = get_score_cache()
+    if refresh:
+        return _compute_and_set(cache_key, compute)
+    value = cache.get(cache_key)
+    if value is not None:
+        return value
+
+    lock_key = f"{cache_key}:lock"
+    stale_value = cache.get(get_stale_key(cache_key)) if serve_stale else None
+    if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        if stale_value is None or not getattr(settings, "FISHERIESCAPE_STALE_WHILE_REVALIDATE", True):
+            return _compute_and_set(cache_key, compute, lock_key)
+        if _pending_revalidations.acquire(blocking=False):
+            _revalidation_executor.submit(_revalidate, cache_key, compute, lock_key)
+        else:
+            # enough payloads are being computed already, a later request will revalidate this one
+            cache.delete(lock_key)
+        return stale_value
+    if stale_value is not None:
+        return stale_value
+
+    # another worker is computing it
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(cache_key)
+        if value is not None:
+            return value
+    # that worker takes too long or died, compute it here as well
+    return _compute_and_set(cache_key, compute)
+
+
+def compress_payload(content, cache_key=None):
+    """
+    Compress an encoded response body once, to be cached and served as is (see get_compressed_response)
+    :param content: the response body, as bytes
+    :param cache_key: the key the payload is cached under, to tell a stale payload (of a previous data version) from
+    a current one
+    :return: a dict of the body per content encoding, gzip and, if the brotli package is installed, br
+    """
+    payload = {"cache_key": cache_key, "gzip": gzip.compress(content, compresslevel=6)}
+    if brotli:
+        payload["br"] = brotli.compress(content, quality=5)
+    return payload
+
+
+def decompress_payload(payload):
+    """Return the plain response body of a payload from compress_payload"""
+    return gzip.decompress(payload["gzip"])
+
+
+def get_accepted_encodings(request):
+    """The content encodings accepted by the client, without those refused with q=0"""
+    accepted_encodings = set()
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        encoding, _, params = item.partition(";")
+        name, _, quality = params.partition("=")
+        if name.strip() == "q":
+            try:
+                if float(quality) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted_encodings.add(encoding.strip().lower())
+    return accepted_encodings
+
+
+def get_response_encoding(request):
+    """The encoding get_compressed_response will serve to this client: br, gzip or identity"""
+    accepted_encodings = get_accepted_encodings(request)
+    if brotli and "br" in accepted_encodings:
+        return "br"
+    if "gzip" in accepted_encodings:
+        return "gzip"
+    return "identity"
+
+
+def get_compressed_response(request, payload, content_type="application/json"):
+    """
+    Serve a payload from compress_payload in the best encoding the client accepts. Only the clients that accept no
+    compression at all cost a decompression.
+    """
+    encoding = get_response_encoding(request)
+    if encoding in payload:
+        response = HttpResponse(payload[encoding], content_type=content_type)
+        response["Content-Encoding"] = encoding
+    else:
+        response = HttpResponse(decompress_payload(payload), content_type=content_type)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def get_streaming_response(request, content, content_type="application/json"):
+    """
+    Serve an iterator of bytes as it is produced, gzipped on the fly when the client accepts it. Not cached, the
+    point being to never hold the whole body in memory.
+    """
+    if "gzip" in get_accepted_encodings(request):
+        response = StreamingHttpResponse(compress_sequence(content), content_type=content_type)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = StreamingHttpResponse(content, content_type=content_type)
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def get_response_etag(cache_key, *variants):
+    """
+    A strong ETag for the response of a cached payload. The cache key already holds the data version and the request
+    parameters; the variants are whatever else changes the bytes sent, e.g. the content encoding.
+    """
+    return quote_etag(md5(":".join([cache_key, *variants]).encode('utf-8')).hexdigest())
+
+
+def set_validators(response, etag, last_modified, stale=False):
+    """
+    Add the ETag and Last-Modified headers to a response of the current data version. The browser keeps the response
+    but revalidates it on every use, since the data version can change at any time.
+    :param stale: the response is the one of a previous data version, see get_or_compute. It gets no validators and
+    is not to be stored at all.
+    """
+    if stale:
+        patch_cache_control(response, no_store=True)
+        return response
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def get_not_modified_response(request, etag, last_modified, vary=()):
+    """
+    A 304 response if the client already has the current version of the response (If-None-Match / If-Modified-Since),
+    otherwise None
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+        patch_vary_headers(response, vary)
+    return response
+
+
+def count_combined_species_request(species):
+    """
+    Count a request for a combined species set, for the cache warming to know the most requested ones. The counters
+    are atomic increments, only a set requested for the first time updates the list of sets, which is approximate.
+    """
+    cache = get_score_cache()
+    species = sorted(species)
+    set_key = md5(",".join(species).encode('utf-8')).hexdigest()
+    counter_key = f"{COMBINED_SPECIES_KEY}:{set_key}"
+    if cache.add(counter_key, 1, timeout=None):
+        species_sets = cache.get(COMBINED_SPECIES_KEY, {})
+        if len(species_sets) < MAX_COMBINED_SPECIES_SETS:
+            species_sets[set_key] = species
+            cache.set(COMBINED_SPECIES_KEY, species_sets, timeout=None)
+    else:
+        try:
+            cache.incr(counter_key)
+        except ValueError:
+            # the counter expired in between
+            pass
+
+
+def get_most_requested_combined_species(count=10):
+    """The `count` combined species sets requested the most, most requested first"""
+    cache = get_score_cache()
+    species_sets = cache.get(COMBINED_SPECIES_KEY, {})
+    counters = cache.get_many([f"{COMBINED_SPECIES_KEY}:{set_key}" for set_key in species_sets])
+    ranked_keys = sorted(species_sets, key=lambda set_key: counters.get(f"{COMBINED_SPECIES_KEY}:{set_key}", 0),
+                         reverse=True)
+    return [species_sets[set_key] for set_key in ranked_keys[:count]]
@@ -0,0 +1,186 @@
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import uuid
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from fisheriescape import models
+from fisheriescape.api.queries import SEASON_WEEKS
+from fisheriescape.caching import get_score_version
+
+# The score cube: every fs_score as a dense float32 array of [species, week, hexagon], NaN where there is no score,
+# written once after each score import and memory-mapped read-only by every worker process. The pages of the file are
+# shared by all the processes of the host, so the workers hold a single physical copy of the scores.
+#
+# The cube is two files: the data file, named after its build, and the index file (score_cube.json), which gives the
+# species, weeks and hexagons of each axis and the data file to read. Both are written next to their final name and
+# renamed into place, the index last, so a worker always maps a complete cube. A cube is valid until the next score
+# import, see caching.bump_score_version.
+#
+# ScoreValuesView and the binary format of ScoreTimeseriesView read the cube. The JSON time series keep the full
+# precision of the database sums, which float32 does not have, and the score features and zonal statistics need the
+# hexagon geometries of PostGIS, so they stay on SQL.
+
+INDEX_FILE = "score_cube.json"
+DATA_FILE_PATTERN = "score_cube-{build}.f32"
+
+CUBE_SLAB_SQL = """
+    SELECT w.week_number, s.hexagon_id, s.fs_score::float8
+    FROM fisheriescape_score s
+             JOIN fisheriescape_week w ON w.id = s.week_id
+    WHERE s.species_id = %(species_id)s
+      AND w.week_number BETWEEN 1 AND %(weeks)s
+      AND s.fs_score IS NOT NULL
+"""
+
+
+def get_score_cube_dir():
+    return getattr(settings, "FISHERIESCAPE_SCORE_CUBE_DIR", os.path.join(tempfile.gettempdir(), "fisheriescape"))
+
+
+def build_score_cube(directory=None, chunk_size=10000):
+    """
+    Dump the fs_scores into a new score cube, one species at a time, and swap it in place of the current one. Workers
+    pick it up on their next request, the old data file is unlinked but stays readable by the workers still mapping it.
+    :param directory: directory of the cube files, the FISHERIESCAPE_SCORE_CUBE_DIR setting by default
+    :return: the index of the new cube
+    """
+    directory = directory or get_score_cube_dir()
+    os.makedirs(directory, exist_ok=True)
+    # read before the scores, so that a cube built while an import commits is already out of date
+    score_version = get_score_version()
+    hexagons = list(models.Hexagon.objects.order_by('id').values_list('id', 'grid_id'))
+    species = list(models.Species.objects.filter(id__in=models.Score.objects.values('species_id'))
+                   .order_by('id').values_list('id', 'english_name'))
+    hexagon_ids = np.array([hexagon_id for hexagon_id, grid_id in hexagons], dtype=np.int64)
+
+    build = uuid.uuid4().hex
+    data_file = DATA_FILE_PATTERN.format(build=build)
+    data_path = os.path.join(directory, data_file)
+    with open(f"{data_path}.tmp", "wb") as f:
+        for species_id, english_name in species:
+            slab = np.full((SEASON_WEEKS, len(hexagons)), np.nan, dtype=np.float32)
+            with connection.cursor() as cursor:
+                cursor.execute(CUBE_SLAB_SQL, {"species_id": species_id, "weeks": SEASON_WEEKS})
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    week_numbers, row_hexagon_ids, fs_scores = np.array(rows, dtype=np.float64).T
+                    # the hexagon ids are sorted, their position is the index of the hexagon axis
+                    slab[week_numbers.astype(np.intp) - 1,
+                         np.searchsorted(hexagon_ids, row_hexagon_ids.astype(np.int64))] = fs_scores
+            slab.tofile(f)
+    os.replace(f"{data_path}.tmp", data_path)
+
+    index = {
+        "build": build,
+        "score_version": score_version,
+        "data_file": data_file,
+        "weeks": SEASON_WEEKS,
+        "species": species,
+        "hexagons": hexagons,
+    }
+    index_path = os.path.join(directory, INDEX_FILE)
+    with open(f"{index_path}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{index_path}.tmp", index_path)
+
+    for path in glob.glob(os.path.join(directory, DATA_FILE_PATTERN.format(build="*"))):
+        if path != data_path:
+            os.remove(path)
+    return index
+
+
+class ScoreCube:
+    """A read-only, memory-mapped score cube, see build_score_cube"""
+
+    def __init__(self, index, scores, directory=None, mtime=None):
+        self.score_version = index["score_version"]
+        self.weeks = index["weeks"]
+        self.species = {english_name: i for i, (species_id, english_name) in enumerate(index["species"])}
+        self.hexagon_ids = array("i", [hexagon_id for hexagon_id, grid_id in index["hexagons"]])
+        # a [species, week, hexagon] float32 array
+        self.scores = scores
+        self.directory = directory
+        self.mtime = mtime
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = directory or get_score_cube_dir()
+        index_path = os.path.join(directory, INDEX_FILE)
+        with open(index_path) as f:
+            mtime = os.fstat(f.fileno()).st_mtime_ns
+            index = json.load(f)
+        shape = (len(index["species"]), index["weeks"], len(index["hexagons"]))
+        if all(shape):
+            scores = np.memmap(os.path.join(directory, index["data_file"]), dtype=np.float32, mode="r", shape=shape)
+        else:
+            # no scores at all, which mmap cannot map
+            scores = np.empty(shape, dtype=np.float32)
+        return cls(index, scores, directory=directory, mtime=mtime)
+
+    def get_week_scores(self, species, week):
+        """The fs_scores of a species and week number, per hexagon in hexagon id order, as a view of the mapped file"""
+        return self.scores[self.species[species], week - 1]
+
+    def sum_species(self, species, weeks=slice(None)):
+        """
+        The fs_scores of the weeks (an index or slice of the week axis) summed over the species, as float64; NaN where
+        none of the species has a score, as in queries.get_score_values.
+        """
+        scores = self.scores[[self.species[name] for name in species if name in self.species], weeks]
+        values = np.nansum(scores, axis=0, dtype=np.float64)
+        values[np.isnan(scores).all(axis=0)] = np.nan
+        return values
+
+    def get_week_values(self, species, week):
+        """The fs_scores of a week number, summed over the species, per hexagon in hexagon id order"""
+        if not 1 <= week <= self.weeks:
+            return [math.nan] * len(self.hexagon_ids)
+        return self.sum_species(species, week - 1).tolist()
+
+    def get_timeseries_columns(self, species):
+        """Same as queries.get_score_timeseries_columns, read from the cube"""
+        # [week, hexagon]
+        values = self.sum_species(species)
+        scored = ~np.isnan(values).all(axis=0)
+        return {
+            "hexagon": array("i", np.frombuffer(self.hexagon_ids, dtype=np.int32)[scored].tobytes()),
+            "fs_score": array("f", values[:, scored].T.astype(np.float32).tobytes()),
+        }
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_score_cube():
+    """
+    The score cube of this process, mapped on first use and mapped again whenever a new one is built. None if there is
+    no cube of the current score version, in which case the callers query the database as usual.
+    """
+    global _cube
+    directory = get_score_cube_dir()
+    try:
+        mtime = os.stat(os.path.join(directory, INDEX_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _cube_lock:
+        if _cube is None or _cube.directory != directory or _cube.mtime != mtime:
+            try:
+                _cube = ScoreCube.load(directory)
+            except FileNotFoundError:
+                # swapped while it was being read, the next request maps the new one
+                return None
+        cube = _cube
+    if cube.score_version != get_score_version():
+        return None
+    return cube
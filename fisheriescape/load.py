@@ -7,8 +7,11 @@
 import os
 
 from django.contrib.gis.utils import LayerMapping
+from django.db import connection, transaction
 
-from .models import FisheryArea, Hexagon, Score, NAFOArea
+from .caching import bump_data_version
+from .models import FisheryArea, Hexagon, HexagonAreaOverlap, Score, NAFOArea
+from .utils import GEOMETRY_RESOLUTIONS
 
 # For NAFO_select.shp
 nafo_select_shp_mapping = {
@@ -22,9 +25,11 @@ nafo_select_shp = os.path.abspath(
 )
 
 
-def nafo_select_shp_run(verbose=True):
+def nafo_select_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(NAFOArea, nafo_select_shp, nafo_select_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run(layers=['nafo_area'])
 
 
 # For NAFO_subzones.shp
@@ -39,9 +44,11 @@ nafo_shp = os.path.abspath(
 )
 
 
-def nafo_shp_run(verbose=True):
+def nafo_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(FisheryArea, nafo_shp, nafo_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run(layers=['fishery_area'])
 
 
 # For Snow Crab.shp
@@ -56,9 +63,11 @@ crab_shp = os.path.abspath(
 )
 
 
-def crab_shp_run(verbose=True):
+def crab_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(FisheryArea, crab_shp, crab_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run(layers=['fishery_area'])
 
 
 ## For Lobster.shp
@@ -73,9 +82,11 @@ lobster_shp = os.path.abspath(
 )
 
 
-def lobster_shp_run(verbose=True):
+def lobster_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(FisheryArea, lobster_shp, lobster_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run(layers=['fishery_area'])
 
 
 ## For Groundfish.shp
@@ -90,9 +101,11 @@ groundfish_shp = os.path.abspath(
 )
 
 
-def groundfish_shp_run(verbose=True):
+def groundfish_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(FisheryArea, groundfish_shp, groundfish_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run(layers=['fishery_area'])
 
 
 ## For Herring.shp
@@ -107,9 +120,11 @@ herring_shp = os.path.abspath(
 )
 
 
-def herring_shp_run(verbose=True):
+def herring_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(FisheryArea, herring_shp, herring_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run(layers=['fishery_area'])
 
 
 # For hexagons
@@ -123,9 +138,11 @@ hexagon_shp = os.path.abspath(
 )
 
 
-def hexagon_shp_run(verbose=True):
+def hexagon_shp_run(verbose=True, refresh_overlaps=True):
     lm = LayerMapping(Hexagon, hexagon_shp, hexagon_shp_mapping, transform=False)
     lm.save(strict=True, verbose=verbose)
+    if refresh_overlaps:
+        hexagon_area_overlaps_run()
 
 
 # For hexagon scores from a shapefile
@@ -148,45 +165,118 @@ def site_score_shp_run(verbose=True):
     lm.save(strict=True, verbose=verbose)
 
 
+# For the simplified polygons served at low zoom levels
+simplified_layer_tables = {
+    'hexagon': Hexagon._meta.db_table,
+    'fishery_area': FisheryArea._meta.db_table,
+    'nafo_area': NAFOArea._meta.db_table,
+}
+
+simplify_polygons_sql = """
+    INSERT INTO fisheriescape_simplifiedpolygon (layer, resolution, object_id, polygon)
+    SELECT %(layer)s, %(resolution)s, id, ST_Multi(ST_SimplifyPreserveTopology(polygon, %(tolerance)s))
+    FROM {table}
+"""
+
+
+def simplify_polygons_run(layers=None):
+    """ (re)build the SimplifiedPolygon rows of the given layers (all layers if None) at every GEOMETRY_RESOLUTIONS """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for layer in layers or simplified_layer_tables:
+            cursor.execute("DELETE FROM fisheriescape_simplifiedpolygon WHERE layer = %s", [layer])
+            for resolution, tolerance, max_zoom in GEOMETRY_RESOLUTIONS:
+                cursor.execute(simplify_polygons_sql.format(table=simplified_layer_tables[layer]), {
+                    'layer': layer,
+                    'resolution': resolution,
+                    'tolerance': tolerance,
+                })
+    bump_data_version()
+
+
+# For the FisheryArea and NAFOArea overlaps of the hexagons
+hexagon_area_overlap_tables = {
+    'fishery_area': FisheryArea._meta.db_table,
+    'nafo_area': NAFOArea._meta.db_table,
+}
+
+hexagon_area_overlaps_sql = """
+    INSERT INTO {overlap_table} (hexagon_id, fishery_area_id, nafo_area_id, overlap_fraction)
+    SELECT * FROM ({selects}) overlaps
+    WHERE overlap_fraction > 0
+"""
+
+# hexagons entirely inside an area, most of them, skip the intersection
+hexagon_area_overlap_select_sql = """
+    SELECT h.id, {fishery_area_id}, {nafo_area_id},
+           CASE WHEN ST_Within(h.polygon, a.polygon) THEN 1.0
+                ELSE ST_Area(ST_Intersection(h.polygon, ST_MakeValid(a.polygon))) / NULLIF(ST_Area(h.polygon), 0)
+           END AS overlap_fraction
+    FROM {hexagon_table} h
+    JOIN {area_table} a ON ST_Intersects(h.polygon, a.polygon)
+"""
+
+
+def hexagon_area_overlaps_run(layers=None):
+    """ (re)build the HexagonAreaOverlap rows of the given area layers (all layers if None), in a single statement """
+    layers = layers or list(hexagon_area_overlap_tables)
+    selects = [
+        hexagon_area_overlap_select_sql.format(
+            fishery_area_id="a.id" if layer == 'fishery_area' else "NULL::integer",
+            nafo_area_id="a.id" if layer == 'nafo_area' else "NULL::integer",
+            hexagon_table=Hexagon._meta.db_table,
+            area_table=hexagon_area_overlap_tables[layer],
+        )
+        for layer in layers
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for layer in layers:
+            cursor.execute(f"DELETE FROM {HexagonAreaOverlap._meta.db_table} WHERE {layer}_id IS NOT NULL")
+        cursor.execute(hexagon_area_overlaps_sql.format(
+            overlap_table=HexagonAreaOverlap._meta.db_table,
+            selects=" UNION ALL ".join(selects),
+        ))
+    bump_data_version()
+
+
 def run():
     try:
         print('Import nafo_select_shp ...')
-        nafo_select_shp_run()
+        nafo_select_shp_run(refresh_overlaps=False)
         print('✅ nafo_select_shp imported')
     except Exception as e:
         print(f'❌ nafo_select_shp import failed : {e}')
 
     try:
         print('Import nafo_shp ...')
-        nafo_shp_run()
+        nafo_shp_run(refresh_overlaps=False)
         print('✅ nafo_shp imported')
     except Exception as e:
         print(f'❌ nafo_shp import failed : {e}')
 
     try:
         print('Import crab_shp ...')
-        crab_shp_run()
+        crab_shp_run(refresh_overlaps=False)
         print('✅ crab_shp imported')
     except Exception as e:
         print(f'❌ crab_shp import failed : {e}')
 
     try:
         print('Import lobster_shp ...')
-        lobster_shp_run()
+        lobster_shp_run(refresh_overlaps=False)
         print('✅ lobster_shp imported')
     except Exception as e:
         print(f'❌ lobster_shp import failed : {e}')
 
     try:
         print('Import groundfish_shp ...')
-        groundfish_shp_run()
+        groundfish_shp_run(refresh_overlaps=False)
         print('✅ groundfish_shp imported')
     except Exception as e:
         print(f'❌ groundfish_shp import failed : {e}')
 
     try:
         print('Import herring_shp ...')
-        herring_shp_run()
+        herring_shp_run(refresh_overlaps=False)
         print('✅ herring_shp imported')
     except Exception as e:
         print(f'❌ herring_shp import failed : {e}')
@@ -194,7 +284,7 @@ def run():
 
     try:
         print('Import hexagon_shp ...')
-        hexagon_shp_run()
+        hexagon_shp_run(refresh_overlaps=False)
         print('✅ hexagon_shp imported')
     except Exception as e:
         print(f'❌ hexagon_shp import failed : {e}')
@@ -205,3 +295,17 @@ def run():
         print('✅ site_score_shp imported')
     except Exception as e:
         print(f'❌ site_score_shp import failed : {e}')
+
+    try:
+        print('Simplify polygons ...')
+        simplify_polygons_run()
+        print('✅ polygons simplified')
+    except Exception as e:
+        print(f'❌ polygon simplification failed : {e}')
+
+    try:
+        print('Compute hexagon area overlaps ...')
+        hexagon_area_overlaps_run()
+        print('✅ hexagon area overlaps computed')
+    except Exception as e:
+        print(f'❌ hexagon area overlap computation failed : {e}')
@@ -0,0 +1,60 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from fisheriescape import models
+from fisheriescape.api.queries import get_combined_score_feature_collection
+from fisheriescape.api.serializers import ScoreFeatureSerializer
+from fisheriescape.caching import get_cache_key
+
+
+class Command(BaseCommand):
+    help = "Compare the hit latency of the score endpoint payloads between cache backends, e.g. default vs database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("aliases", nargs="*", help="cache aliases to compare, all the configured caches by default")
+        parser.add_argument("--species", default="Snow Crab", help="english name of the species to cache the scores of")
+        parser.add_argument("--week", type=int, default=30, help="week number to cache the scores of")
+        parser.add_argument("--repeat", type=int, default=50, help="number of hits timed per payload and cache")
+
+    def get_payloads(self, species, week):
+        queryset = models.Score.objects.filter(species__english_name=species, week__week_number=week) \
+            .select_related('week', 'species', 'hexagon')
+        return {
+            "scores-feature": ScoreFeatureSerializer(queryset, many=True).data,
+            "scores-feature-combined": get_combined_score_feature_collection(species=[species], week=week),
+        }
+
+    def time_hits(self, cache, key, repeat, skip_local=False):
+        timings = []
+        for i in range(repeat):
+            if skip_local:
+                cache.clear_local()
+            start = time.perf_counter()
+            cache.get(key)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return statistics.mean(timings), statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or list(settings.CACHES)
+        payloads = self.get_payloads(options["species"], options["week"])
+        row = "{:<12} {:<24} {:<8} {:>10} {:>10} {:>10}"
+        self.stdout.write(row.format("cache", "payload", "tier", "mean ms", "p50 ms", "p95 ms"))
+        for alias in aliases:
+            cache = caches[alias]
+            for name, payload in payloads.items():
+                # a versioned key, like the payloads, for the in-process tier to keep it
+                key = get_cache_key(f"benchmark-{name}", species=options["species"], week=options["week"])
+                cache.set(key, payload, timeout=300)
+                tiers = [("all", False)]
+                if hasattr(cache, "clear_local"):
+                    # also time the hits that have to go to redis
+                    tiers.append(("remote", True))
+                for tier, skip_local in tiers:
+                    mean, p50, p95 = self.time_hits(cache, key, options["repeat"], skip_local=skip_local)
+                    self.stdout.write(row.format(alias, name, tier, f"{mean:.3f}", f"{p50:.3f}", f"{p95:.3f}"))
+                cache.delete(key)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from fisheriescape.cube import build_score_cube
+
+
+class Command(BaseCommand):
+    help = "Dump the scores into a new memory-mapped score cube, see fisheriescape.cube. Run after a score import"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", help="directory of the cube files, the FISHERIESCAPE_SCORE_CUBE_DIR setting "
+                                                "by default")
+
+    def handle(self, *args, **options):
+        index = build_score_cube(directory=options["directory"])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ score cube built: {len(index['species'])} species x {index['weeks']} weeks x "
+            f"{len(index['hexagons'])} hexagons"
+        ))
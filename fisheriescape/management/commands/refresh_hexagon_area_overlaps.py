@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from fisheriescape import load
+
+
+class Command(BaseCommand):
+    help = "Rebuild the fishery area and NAFO area overlaps of the hexagons. The shapefile loaders already do it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("layers", nargs="*", choices=list(load.hexagon_area_overlap_tables),
+                            help="area layers to rebuild the overlaps of, all of them by default")
+
+    def handle(self, *args, **options):
+        load.hexagon_area_overlaps_run(layers=options["layers"])
+        self.stdout.write(self.style.SUCCESS("✅ hexagon area overlaps computed"))
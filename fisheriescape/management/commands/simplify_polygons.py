@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from fisheriescape import load
+
+
+class Command(BaseCommand):
+    help = "Rebuild the simplified hexagon, fishery area and NAFO area polygons. Run after load.run()"
+
+    def add_arguments(self, parser):
+        parser.add_argument("layers", nargs="*", choices=list(load.simplified_layer_tables),
+                            help="layers to simplify, all of them by default")
+
+    def handle(self, *args, **options):
+        load.simplify_polygons_run(layers=options["layers"])
+        self.stdout.write(self.style.SUCCESS("✅ polygons simplified"))
@@ -0,0 +1,79 @@
+# Generated by Django 4.1.6 on 2023-06-12 14:21
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fisheriescape", "0009_delete_analyses"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpeciesScoreStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "score_count",
+                    models.IntegerField(default=0, verbose_name="score count"),
+                ),
+                (
+                    "max_fs_score",
+                    models.FloatField(blank=True, null=True, verbose_name="max fs score"),
+                ),
+                (
+                    "min_fs_score",
+                    models.FloatField(blank=True, null=True, verbose_name="min fs score"),
+                ),
+                (
+                    "mean_fs_score",
+                    models.FloatField(blank=True, null=True, verbose_name="mean fs score"),
+                ),
+                (
+                    "quantile_breaks",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.FloatField(),
+                        blank=True,
+                        null=True,
+                        size=None,
+                        verbose_name="fs score deciles",
+                    ),
+                ),
+                (
+                    "species",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="score_stats",
+                        to="fisheriescape.species",
+                        verbose_name="species",
+                    ),
+                ),
+                (
+                    "week",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="score_stats",
+                        to="fisheriescape.week",
+                        verbose_name="week",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["species", "week"],
+                "unique_together": {("species", "week")},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.6 on 2023-06-19 15:02
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fisheriescape", "0010_speciesscorestats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimplifiedPolygon",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "layer",
+                    models.CharField(
+                        choices=[
+                            ("hexagon", "Hexagon"),
+                            ("fishery_area", "Fishery Area"),
+                            ("nafo_area", "NAFO Area"),
+                        ],
+                        max_length=50,
+                        verbose_name="layer",
+                    ),
+                ),
+                ("object_id", models.IntegerField(verbose_name="object id")),
+                (
+                    "resolution",
+                    models.CharField(max_length=50, verbose_name="resolution"),
+                ),
+                (
+                    "polygon",
+                    django.contrib.gis.db.models.fields.MultiPolygonField(srid=4326),
+                ),
+            ],
+            options={
+                "unique_together": {("layer", "resolution", "object_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.6 on 2023-07-04 10:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fisheriescape", "0011_simplifiedpolygon"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HexagonAreaOverlap",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "overlap_fraction",
+                    models.FloatField(
+                        verbose_name="fraction of the hexagon area inside the area"
+                    ),
+                ),
+                (
+                    "fishery_area",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hexagon_overlaps",
+                        to="fisheriescape.fisheryarea",
+                        verbose_name="fishery area",
+                    ),
+                ),
+                (
+                    "hexagon",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="area_overlaps",
+                        to="fisheriescape.hexagon",
+                        verbose_name="hexagon",
+                    ),
+                ),
+                (
+                    "nafo_area",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hexagon_overlaps",
+                        to="fisheriescape.nafoarea",
+                        verbose_name="nafo area",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("hexagon", "fishery_area", "nafo_area")},
+            },
+        ),
+    ]
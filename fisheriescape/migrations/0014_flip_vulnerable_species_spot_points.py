@@ -0,0 +1,28 @@
+# Generated by Django 4.1.6 on 2023-07-14 09:12
+
+from django.db import migrations
+
+# The spots used to be imported as Point(lat, lon). Every spot is in Atlantic Canada, so a spot with a positive x and a
+# negative y is one of those: its coordinates are swapped back to Point(lon, lat).
+FLIP_SPOT_POINTS_SQL = """
+    UPDATE fisheriescape_vulnerablespeciesspot
+    SET point = ST_FlipCoordinates(point)
+    WHERE ST_X(point) > 0 AND ST_Y(point) < 0
+"""
+
+UNFLIP_SPOT_POINTS_SQL = """
+    UPDATE fisheriescape_vulnerablespeciesspot
+    SET point = ST_FlipCoordinates(point)
+    WHERE ST_X(point) < 0 AND ST_Y(point) > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("fisheriescape", "0013_importjob"),
+    ]
+
+    operations = [
+        migrations.RunSQL(FLIP_SPOT_POINTS_SQL, reverse_sql=UNFLIP_SPOT_POINTS_SQL),
+    ]
@@ -2,8 +2,10 @@ import os
 
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.gis.db import models
+from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MaxValueValidator, MinValueValidator
 
 from shared_models.models import MetadataFields
@@ -321,6 +323,47 @@ class Hexagon(models.Model):
         ]
 
 
+SIMPLIFIED_LAYER_CHOICES = (
+    ("hexagon", "Hexagon"),
+    ("fishery_area", "Fishery Area"),
+    ("nafo_area", "NAFO Area"),
+)
+
+
+class SimplifiedPolygon(models.Model):
+    """
+    Precomputed lower resolution versions of the Hexagon, FisheryArea and NAFOArea polygons, see
+    load.simplify_polygons_run
+    """
+    layer = models.CharField(max_length=50, choices=SIMPLIFIED_LAYER_CHOICES, verbose_name=_("layer"))
+    object_id = models.IntegerField(verbose_name=_("object id"))
+    resolution = models.CharField(max_length=50, verbose_name=_("resolution"))
+    polygon = models.MultiPolygonField(srid=4326)
+
+    def __str__(self):
+        return "{} {} ({})".format(self.layer, self.object_id, self.resolution)
+
+    class Meta:
+        unique_together = (('layer', 'resolution', 'object_id'),)
+
+
+class HexagonAreaOverlap(models.Model):
+    """Precomputed FisheryArea and NAFOArea overlaps of every Hexagon, see load.hexagon_area_overlaps_run"""
+    hexagon = models.ForeignKey(Hexagon, on_delete=models.CASCADE, related_name="area_overlaps",
+                                verbose_name=_("hexagon"))
+    fishery_area = models.ForeignKey(FisheryArea, on_delete=models.CASCADE, blank=True, null=True,
+                                     related_name="hexagon_overlaps", verbose_name=_("fishery area"))
+    nafo_area = models.ForeignKey(NAFOArea, on_delete=models.CASCADE, blank=True, null=True,
+                                  related_name="hexagon_overlaps", verbose_name=_("nafo area"))
+    overlap_fraction = models.FloatField(verbose_name=_("fraction of the hexagon area inside the area"))
+
+    def __str__(self):
+        return "{} - {}".format(self.hexagon.grid_id, self.fishery_area or self.nafo_area)
+
+    class Meta:
+        unique_together = (('hexagon', 'fishery_area', 'nafo_area'),)
+
+
 class Score(models.Model):
     hexagon = models.ForeignKey(Hexagon, on_delete=models.DO_NOTHING, related_name="scores",
                                 verbose_name=_("hexagon"))
@@ -350,6 +393,30 @@ class Score(models.Model):
         ]
 
 
+class SpeciesScoreStats(models.Model):
+    """fs_score statistics per species, for the whole season (week is null) and per week. Refreshed on score imports"""
+    species = models.ForeignKey(Species, on_delete=models.CASCADE, related_name="score_stats",
+                                verbose_name=_("species"))
+    week = models.ForeignKey(Week, on_delete=models.CASCADE, blank=True, null=True, related_name="score_stats",
+                             verbose_name=_("week"))
+    score_count = models.IntegerField(default=0, verbose_name=_("score count"))
+    max_fs_score = models.FloatField(blank=True, null=True, verbose_name=_("max fs score"))
+    min_fs_score = models.FloatField(blank=True, null=True, verbose_name=_("min fs score"))
+    mean_fs_score = models.FloatField(blank=True, null=True, verbose_name=_("mean fs score"))
+    quantile_breaks = ArrayField(models.FloatField(), blank=True, null=True, verbose_name=_("fs score deciles"))
+
+    def __str__(self):
+        my_str = "{}".format(self.species.english_name)
+
+        if self.week:
+            my_str += f' ({self.week.week_number})'
+        return my_str
+
+    class Meta:
+        ordering = ['species', 'week', ]
+        unique_together = (('species', 'week'),)
+
+
 class VulnerableSpeciesSpot(models.Model):
     vulnerable_species = models.ForeignKey(VulnerableSpecies, on_delete=models.DO_NOTHING, related_name="spots",
                                            verbose_name=_("vulnerable_species"))
@@ -374,3 +441,82 @@ class VulnerableSpeciesSpot(models.Model):
             models.Index(["week"], name="%(class)s_week"),
             models.Index(["species"], name="%(class)s_species")
         ]
+
+
+IMPORT_KIND_CHOICES = (
+    ("scores", "Fisheriescape scores"),
+    ("vulnerable_species_spots", "Vulnerable species spots"),
+)
+
+IMPORT_STATUS_CHOICES = (
+    ("pending", "Pending"),
+    ("running", "Running"),
+    ("succeeded", "Succeeded"),
+    ("failed", "Failed"),
+)
+
+# errors kept in the progress of a running import job, the job itself keeps them all once it is finished
+MAX_IMPORT_PROGRESS_ERRORS = 100
+
+
+class ImportJob(MetadataFields):
+    """A csv file uploaded to be imported by a celery worker, see tasks.run_import_job"""
+    kind = models.CharField(max_length=50, choices=IMPORT_KIND_CHOICES, verbose_name=_("kind"))
+    file = models.FileField(upload_to="fisheriescape/imports/", verbose_name=_("file"))
+    status = models.CharField(max_length=20, choices=IMPORT_STATUS_CHOICES, default="pending",
+                              verbose_name=_("status"))
+    rows_processed = models.IntegerField(default=0, verbose_name=_("rows processed"))
+    count_success = models.IntegerField(default=0, verbose_name=_("datapoints imported"))
+    errors = ArrayField(models.TextField(), default=list, blank=True, verbose_name=_("errors"))
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name=_("started at"))
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name=_("finished at"))
+
+    def __str__(self):
+        return "{} ({})".format(self.get_kind_display(), self.status)
+
+    class Meta:
+        ordering = ['-created_at', ]
+
+    @property
+    def progress_cache_key(self):
+        return f"fisheriescape:import-job:{self.id}"
+
+    def set_progress(self, rows_processed, count_success, errors):
+        """
+        Publish the progress of the running import. It goes to the cache rather than the database, where it would only
+        be seen once the transaction of the import commits.
+        """
+        # the models do not depend on the cache stack, only the import jobs use it
+        from fisheriescape.caching import get_score_cache
+        get_score_cache().set(self.progress_cache_key, {
+            "rows_processed": rows_processed,
+            "count_success": count_success,
+            "error_count": len(errors),
+            "errors": errors[:MAX_IMPORT_PROGRESS_ERRORS],
+        }, timeout=60 * 60 * 24)
+
+    def get_progress(self):
+        """The rows processed, datapoints imported and errors of the job so far, and its rows per second"""
+        progress = {
+            "rows_processed": self.rows_processed,
+            "count_success": self.count_success,
+            "error_count": len(self.errors),
+            "errors": self.errors[:MAX_IMPORT_PROGRESS_ERRORS],
+        }
+        if self.status == "running":
+            from fisheriescape.caching import get_score_cache
+            progress.update(get_score_cache().get(self.progress_cache_key, {}))
+
+        rows_per_second = None
+        if self.started_at:
+            seconds = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+            rows_per_second = round(progress["rows_processed"] / seconds, 1) if seconds else None
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "rows_per_second": rows_per_second,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **progress,
+        }
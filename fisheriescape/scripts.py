@@ -1,13 +1,32 @@
+import codecs
 import csv
 import datetime
+import io
+import itertools
 import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from decimal import Decimal, InvalidOperation
+from functools import cached_property
 
+import django
 from django.contrib.gis.geos import Point
+from django.db import connection, connections, transaction
 from django.utils import timezone
 from django.core import serializers
 
 from fisheriescape import models
+from fisheriescape.caching import bump_data_version, bump_score_version
+
+# rows between two progress reports of the importers
+IMPORT_PROGRESS_INTERVAL = 1000
+
+# vulnerable species spots saved per transaction
+VULNERABLE_SPOTS_BATCH_SIZE = 1000
+
+# files imported at the same time by import_all_scores and import_all_vulnerable_species_spots, one process each
+IMPORT_WORKERS = os.cpu_count() or 1
 
 
 # to get list of url names from rest api
@@ -129,6 +148,71 @@ def many_var_fish(row_name, instance_name, model_name):
         return
 
 
+class ImportContext:
+    """
+    The ids of the rows the csv importers refer to, loaded once on first use and kept for the whole import rather than
+    queried for each row: hexagons by grid_id, species and vulnerable species by lowercase english name (the
+    english_name__iexact matching of the importers) and weeks by week number. The missing species and weeks are created
+    in batches by the create_missing_* methods. A context can be shared by the files of a folder, see import_folder.
+    A read-only context, see read_only_copy, creates nothing: the rows it does not know are reported by the importers.
+    """
+    read_only = False
+
+    @staticmethod
+    def load_ids(queryset, field, key=None) -> dict:
+        ids = {}
+        # the lowest id of duplicated rows wins, as get_or_create would pick
+        for row_id, value in queryset.filter(**{f"{field}__isnull": False}).order_by('-id').values_list('id', field):
+            ids[key(value) if key else value] = row_id
+        return ids
+
+    def create_missing(self, ids, model, field, values, key=None):
+        """ create the rows of the values missing from ids with a single query, named as first spelled """
+        if self.read_only:
+            return
+        new_objects = {}
+        for value in values:
+            value_key = key(value) if key else value
+            if value_key not in ids and value_key not in new_objects:
+                new_objects[value_key] = model(**{field: value})
+        for value_key, obj in zip(new_objects, model.objects.bulk_create(new_objects.values())):
+            ids[value_key] = obj.id
+
+    @cached_property
+    def hexagons(self) -> dict:
+        return self.load_ids(models.Hexagon.objects, 'grid_id')
+
+    @cached_property
+    def species(self) -> dict:
+        return self.load_ids(models.Species.objects, 'english_name', key=str.lower)
+
+    @cached_property
+    def vulnerable_species(self) -> dict:
+        return self.load_ids(models.VulnerableSpecies.objects, 'english_name', key=str.lower)
+
+    @cached_property
+    def weeks(self) -> dict:
+        return self.load_ids(models.Week.objects, 'week_number')
+
+    def create_missing_species(self, english_names):
+        self.create_missing(self.species, models.Species, 'english_name', english_names, key=str.lower)
+
+    def create_missing_vulnerable_species(self, english_names):
+        self.create_missing(self.vulnerable_species, models.VulnerableSpecies, 'english_name', english_names,
+                            key=str.lower)
+
+    def create_missing_weeks(self, week_numbers):
+        self.create_missing(self.weeks, models.Week, 'week_number', week_numbers)
+
+    def read_only_copy(self):
+        """ a read-only copy of the context with every lookup loaded, to pass to other processes """
+        copy = ImportContext()
+        copy.__dict__.update(hexagons=self.hexagons, species=self.species, vulnerable_species=self.vulnerable_species,
+                             weeks=self.weeks)
+        copy.read_only = True
+        return copy
+
+
 def import_fishery_info():
     """ a simple function to import information from a csv """
     csv_file = os.path.abspath(
@@ -142,8 +226,11 @@ def import_fishery_info():
         spamreader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
         # next(spamreader, None)  # skip the headers
         print('Loading...')
-        # for row in spamreader:
-        #     print(row[0])
+        # a first pass creates the missing species in one query, then the file is read again for the fisheries
+        context = ImportContext()
+        context.create_missing_species(row["Species"].strip() for row in spamreader)
+        csvfile.seek(0)
+        spamreader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
         for row in spamreader:
 
             # to get dates with timezone settings
@@ -152,14 +239,9 @@ def import_fishery_info():
             end_date = timezone.datetime(int(row["Year end"]), int(row["Month end"]), int(row["Day end"]),
                                          tzinfo=timezone.get_current_timezone())
 
-            # Get or create FK fields first
-            species_obj, created = models.Species.objects.get_or_create(
-                english_name=row["Species"].strip()
-            )
-
             # main logic for regular field types -- for FK get it first
             created, _ = models.Fishery.objects.get_or_create(
-                species=species_obj,
+                species_id=context.species[row["Species"].strip().lower()],
                 participants=row["Participants"].strip(),
                 participant_detail=row["Participant detail"].strip(),
                 start_date=start_date,
@@ -198,14 +280,14 @@ def import_fishery_info():
         print(f'{str(cont_success)} records inserted successfully! ')
 
 
-def import_scores_info_from_file_path(path: str) -> dict:
+def import_scores_info_from_file_path(path: str, context=None) -> dict:
     """ a simple function to import information from a csv """
     csv_file = path
 
     with open(csv_file, newline='', encoding='UTF-8') as csvfile:
         reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
         print(f"Importing file {csv_file}...")
-        result = import_scores_from_reader(reader=reader)
+        result = import_scores_from_reader(reader=reader, context=context)
 
         print(f"✅ {result.get('count_success')} records inserted successfully! for file {csv_file}")
         print(f"❌ {len(result.get('errors'))} errors for file {csv_file}")
@@ -213,73 +295,200 @@ def import_scores_info_from_file_path(path: str) -> dict:
         return result
 
 
-def import_all_scores(folder_path: str) -> dict:
+def create_score_file_lookups(path: str, context):
+    """ create the species and weeks of the valid rows of a score csv that the context does not know """
+    species, week_numbers = [], []
+    with open(path, newline='', encoding='UTF-8') as csvfile:
+        for row in csv.DictReader(csvfile, delimiter=',', quotechar='"'):
+            # a row that cannot be read is reported by the import
+            with suppress(KeyError, AttributeError, ValueError):
+                grid_id, row_species, week_number, fs_score = parse_score_row(row)
+                if grid_id in context.hexagons:
+                    species.append(row_species)
+                    week_numbers.append(week_number)
+    context.create_missing_species(species)
+    context.create_missing_weeks(week_numbers)
+
+
+def init_import_process():
+    """ set up django in a process of the import pool, which opens its own database connection """
+    django.setup()
+
+
+def file_error(file_path: str, e: Exception) -> dict:
+    """ the result of a file that could not be imported """
+    return {"count_success": 0, "errors": [f"❌ error importing file {file_path} : {e}"]}
+
+
+def import_folder(import_file, create_file_lookups, folder_path: str, workers=IMPORT_WORKERS) -> dict:
+    """
+    Import every file of a folder, up to `workers` files at the same time in a process pool, and merge their results.
+    Each file is imported in its own transaction, a file that fails leaves the others in place.
+    The species and weeks named in the files are created beforehand by this process, which the processes would
+    otherwise race to create, and the files are imported with a read-only ImportContext.
+    :param import_file: function importing a file path, called with the path and an ImportContext
+    :param create_file_lookups: function creating the rows a file refers to, called with the path and an ImportContext
+    :param workers: number of processes, 1 imports the files one after the other in this process (as the tests must,
+    the processes would not see the data of the test transaction)
+    """
     result = {
         "count_success": 0,
         "errors": []
     }
-    for file in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file)
-        if os.path.isfile(file_path):
-            file_result = import_scores_info_from_file_path(path=file_path)
-            result["count_success"] += file_result["count_success"]
-            result["errors"] += file_result["errors"]
+    file_paths = sorted(os.path.join(folder_path, file) for file in os.listdir(folder_path)
+                        if os.path.isfile(os.path.join(folder_path, file)))
+    context = ImportContext()
+    file_results = []
+    for file_path in list(file_paths):
+        try:
+            create_file_lookups(file_path, context)
+        except Exception as e:
+            file_results.append(file_error(file_path, e))
+            file_paths.remove(file_path)
+    context = context.read_only_copy()
+
+    if min(workers, len(file_paths)) > 1:
+        # the forked processes must not share the connection of this one
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(file_paths)),
+                                 initializer=init_import_process) as executor:
+            futures = [executor.submit(import_file, file_path, context) for file_path in file_paths]
+            for file_path, future in zip(file_paths, futures):
+                try:
+                    file_results.append(future.result())
+                except Exception as e:
+                    file_results.append(file_error(file_path, e))
+    else:
+        for file_path in file_paths:
+            try:
+                file_results.append(import_file(file_path, context))
+            except Exception as e:
+                file_results.append(file_error(file_path, e))
+
+    for file_result in file_results:
+        result["count_success"] += file_result["count_success"]
+        result["errors"] += file_result["errors"]
+    return result
+
+
+def import_all_scores(folder_path: str, workers=IMPORT_WORKERS, warm=True) -> dict:
+    """
+    :param warm: whether to queue the build of the score cube and the rendering of the new score layers, before the
+    users ask for them, once the import commits
+    """
+    result = import_folder(import_scores_info_from_file_path, create_score_file_lookups, folder_path, workers=workers)
+    if warm:
+        # the tasks pull in the payloads and the score cube, which the importers do not need otherwise
+        from fisheriescape.tasks import queue_score_refresh
+        queue_score_refresh()
     return result
 
 
-def import_vulnerable_species_spots_from_file_path(file_path: str) -> dict:
+def import_vulnerable_species_spots_from_file_path(file_path: str, context=None) -> dict:
     print(f"Importing file {file_path}...")
 
-    with open(file_path, newline='', encoding='UTF-8') as csvfile:
+    with open(file_path, newline='', encoding='UTF-8') as csvfile, transaction.atomic():
         reader = csv.DictReader(csvfile, delimiter=',', quotechar='"')
-        result = import_vulnerable_species_from_reader(reader=reader)
+        result = import_vulnerable_species_from_reader(reader=reader, context=context)
         print(f"✅ {result.get('count_success')} records inserted successfully! for file {file_path}")
         print(f"❌ {len(result.get('errors'))} errors for file {file_path}")
 
     return result
 
 
-def import_all_vulnerable_species_spots(folder_path: str) -> dict:
-    result = {
-        "count_success": 0,
-        "errors": []
-    }
-    for file in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file)
-        if os.path.isfile(file_path):
-            file_result = import_vulnerable_species_spots_from_file_path(file_path=file_path)
-            result["count_success"] += file_result["count_success"]
-            result["errors"] += file_result["errors"]
-
-    return result
-
-
-def import_vulnerable_species_from_reader(reader: csv.DictReader) -> dict:
+def create_vulnerable_species_spot_file_lookups(file_path: str, context):
+    """ create the vulnerable species and weeks of a vulnerable species spot csv that the context does not know """
+    english_names, week_numbers = [], []
+    with open(file_path, newline='', encoding='UTF-8') as csvfile:
+        for row in csv.DictReader(csvfile, delimiter=',', quotechar='"'):
+            # a row that cannot be read is reported by the import
+            with suppress(KeyError, AttributeError):
+                english_names.append(row["species"].strip().capitalize())
+            with suppress(KeyError, AttributeError, ValueError):
+                week_numbers.append(int(row["SW"].strip()))
+    context.create_missing_vulnerable_species(english_names)
+    context.create_missing_weeks(week_numbers)
+
+
+def import_all_vulnerable_species_spots(folder_path: str, workers=IMPORT_WORKERS) -> dict:
+    return import_folder(import_vulnerable_species_spots_from_file_path, create_vulnerable_species_spot_file_lookups,
+                         folder_path, workers=workers)
+
+
+def iter_upload_lines(chunks, encoding="utf-8-sig"):
+    """
+    Decode an uploaded file chunk by chunk and yield its lines as they come, so that only one chunk is held in memory.
+    A character split between two chunks is completed by the next one, and the utf-8-sig default drops the byte order
+    mark spreadsheet software puts at the start of its csv exports.
+    :param chunks: iterable of bytes, such as UploadedFile.chunks() or File.chunks()
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    for chunk in chunks:
+        # the text after the last "\n" continues in the next chunk
+        complete, newline, pending = (pending + decoder.decode(chunk)).rpartition("\n")
+        if newline:
+            yield from (f"{line}\n" for line in complete.split("\n"))
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def get_upload_reader(file) -> csv.DictReader:
+    """ a csv reader over the rows of an uploaded file, read lazily as the rows are consumed """
+    return csv.DictReader(iter_upload_lines(file.chunks()), delimiter=',', quotechar='"')
+
+
+def iter_batches(iterable, batch_size):
+    """ yield lists of up to batch_size items of an iterable, without reading it ahead of the current batch """
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
+
+
+def import_vulnerable_species_from_reader(reader: csv.DictReader, progress=None, context=None) -> dict:
+    """
+    The rows are saved VULNERABLE_SPOTS_BATCH_SIZE at a time, each batch in a transaction and each row in a savepoint
+    of it, so that a bad row does not roll back the others. The species and weeks missing for a batch are created
+    before its rows.
+    :param progress: optional callable, called with the number of rows processed, the count of successes and the
+    errors so far every IMPORT_PROGRESS_INTERVAL rows
+    :param context: optional ImportContext shared with other imports
+    """
+    context = context or ImportContext()
     count_success = 0
     errors = []
-    for row in reader:
-        try:
-            vulnerable_species_english_name = row["species"].strip().capitalize()
-            vulnerable_species_obj, created = models.VulnerableSpecies.objects.get_or_create(
-                defaults={'english_name': vulnerable_species_english_name},
-                english_name__iexact=vulnerable_species_english_name
-            )
-
-            week_obj, created = models.Week.objects.get_or_create(
-                week_number=row["SW"].strip()
-            )
-
-            created, _ = models.VulnerableSpeciesSpot.objects.get_or_create(
-                vulnerable_species=vulnerable_species_obj,
-                week=week_obj,
-                count=row["number"].strip(),
-                date=datetime.datetime.strptime(row["date"].strip(), '%m/%d/%Y').date(),
-                point=Point(float(row["lat"].strip()), float(row["lon"].strip())),
-            )
-
-            count_success += 1
-        except Exception as e:
-            errors.append(f"❌ error inserting line {row} : {e}")
+    for batch in iter_batches(enumerate(reader, start=1), VULNERABLE_SPOTS_BATCH_SIZE):
+        with transaction.atomic():
+            english_names, week_numbers = [], []
+            for line, row in batch:
+                # a row that cannot be read is reported below
+                with suppress(KeyError, AttributeError):
+                    english_names.append(row["species"].strip().capitalize())
+                with suppress(KeyError, AttributeError, ValueError):
+                    week_numbers.append(int(row["SW"].strip()))
+            context.create_missing_vulnerable_species(english_names)
+            context.create_missing_weeks(week_numbers)
+
+            for line, row in batch:
+                if progress and line % IMPORT_PROGRESS_INTERVAL == 0:
+                    progress(line, count_success, errors)
+                try:
+                    english_name = row["species"].strip().capitalize()
+                    with transaction.atomic():
+                        created, _ = models.VulnerableSpeciesSpot.objects.get_or_create(
+                            vulnerable_species_id=context.vulnerable_species[english_name.lower()],
+                            week_id=context.weeks[int(row["SW"].strip())],
+                            count=row["number"].strip(),
+                            date=datetime.datetime.strptime(row["date"].strip(), '%m/%d/%Y').date(),
+                            point=Point(float(row["lon"].strip()), float(row["lat"].strip())),
+                        )
+
+                    count_success += 1
+                except Exception as e:
+                    errors.append(f"❌ error inserting line {row} : {e}")
+
+    bump_data_version()
 
     return {
         "count_success": count_success,
@@ -287,35 +496,141 @@ def import_vulnerable_species_from_reader(reader: csv.DictReader) -> dict:
     }
 
 
-def import_scores_from_reader(reader: csv.DictReader) -> dict:
+SPECIES_SCORE_STATS_SQL = """
+    INSERT INTO fisheriescape_speciesscorestats
+        (species_id, week_id, score_count, max_fs_score, min_fs_score, mean_fs_score, quantile_breaks)
+    SELECT s.species_id,
+           s.week_id,
+           COUNT(s.fs_score),
+           MAX(s.fs_score)::float8,
+           MIN(s.fs_score)::float8,
+           AVG(s.fs_score)::float8,
+           PERCENTILE_CONT(ARRAY[0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9])
+               WITHIN GROUP (ORDER BY s.fs_score)
+    FROM fisheriescape_score s
+    WHERE s.species_id = ANY(%(species_ids)s)
+    GROUP BY GROUPING SETS ((s.species_id), (s.species_id, s.week_id))
+"""
+
+
+def refresh_species_score_stats(species_ids=None):
+    """ recompute the season and weekly SpeciesScoreStats rows for the given species ids (all species if None) """
+    if species_ids is None:
+        species_ids = models.Species.objects.values_list("id", flat=True)
+    species_ids = list(species_ids)
+    if not species_ids:
+        return
+
+    with transaction.atomic():
+        models.SpeciesScoreStats.objects.filter(species_id__in=species_ids).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(SPECIES_SCORE_STATS_SQL, {"species_ids": species_ids})
+
+
+# valid rows sent to the staging table per COPY, the only rows held in memory
+SCORE_COPY_BATCH_SIZE = 50000
+# fs_score is a numeric(8, 4)
+MAX_FS_SCORE = Decimal(10000)
+
+SCORE_STAGING_TABLE_SQL = """
+    CREATE TEMPORARY TABLE fisheriescape_score_staging (
+        line integer,
+        hexagon_id integer,
+        week_id integer,
+        species_id integer,
+        fs_score numeric
+    ) ON COMMIT DROP
+"""
+
+SCORE_STAGING_COPY_SQL = """
+    COPY fisheriescape_score_staging (line, hexagon_id, week_id, species_id, fs_score) FROM STDIN WITH (FORMAT csv)
+"""
+
+# the last line of the file wins when a hexagon, week and species is repeated
+SCORE_STAGING_UPSERT_SQL = """
+    WITH upserted AS (
+        INSERT INTO fisheriescape_score (hexagon_id, week_id, species_id, fs_score)
+        SELECT DISTINCT ON (st.hexagon_id, st.week_id, st.species_id) st.hexagon_id, st.week_id, st.species_id,
+                                                                       st.fs_score
+        FROM fisheriescape_score_staging st
+        ORDER BY st.hexagon_id, st.week_id, st.species_id, st.line DESC
+        ON CONFLICT (hexagon_id, week_id, species_id) DO UPDATE SET fs_score = EXCLUDED.fs_score
+        RETURNING species_id
+    )
+    SELECT COALESCE(array_agg(DISTINCT species_id), '{}') FROM upserted
+"""
+
+
+def parse_score_row(row: dict) -> tuple:
+    """ the grid_id, species, week number and fs_score of a score csv row, raises ValueError if one is invalid """
+    week_number = int(row["sw"].strip())
+    if not 1 <= week_number <= 53:
+        raise ValueError(f"week {week_number} is not between 1 and 53")
+    try:
+        fs_score = Decimal(row["fs"].strip())
+    except InvalidOperation:
+        raise ValueError(f"fs score {row['fs']} is not a number")
+    if not abs(fs_score) < MAX_FS_SCORE:
+        raise ValueError(f"fs score {fs_score} is out of range")
+    return str(row["grid.id"].strip()), str(row["species"].strip()), week_number, fs_score
+
+
+def copy_score_rows(cursor, rows: list, context):
+    """ create the species and weeks missing for parsed score rows, and send the rows to the staging table """
+    context.create_missing_species(species for line, grid_id, species, week_number, fs_score in rows)
+    context.create_missing_weeks(week_number for line, grid_id, species, week_number, fs_score in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        (line, context.hexagons[grid_id], context.weeks[week_number], context.species[species.lower()], fs_score)
+        for line, grid_id, species, week_number, fs_score in rows
+    )
+    buffer.seek(0)
+    cursor.copy_expert(SCORE_STAGING_COPY_SQL, buffer)
+
+
+def import_scores_from_reader(reader: csv.DictReader, progress=None, context=None) -> dict:
+    """
+    Import the scores of a csv reader in bulk: the rows are resolved to hexagon, week and species ids with an
+    ImportContext, creating the missing species and weeks, copied into a temporary staging table and upserted with a
+    single statement, all in one transaction. Existing scores of a hexagon, week and species are updated. The rows are
+    consumed as they are read and sent SCORE_COPY_BATCH_SIZE at a time, so a reader over a streamed upload (see
+    get_upload_reader) imports a file of any size in constant memory.
+    A row of a hexagon that is not in the grid is reported as an error, hexagons are only created by the grid loads
+    (see load.py): they need a polygon.
+    :param progress: optional callable, called with the number of rows processed, the count of successes and the
+    errors so far every IMPORT_PROGRESS_INTERVAL rows
+    :param context: optional ImportContext shared with other imports
+    """
+    context = context or ImportContext()
     count_success = 0
     errors = []
-    for row in reader:
-        try:
-            # Get or create FK fields first
-            hexagon_obj, created = models.Hexagon.objects.get_or_create(
-                grid_id=str(row["grid.id"].strip())
-            )
-
-            species_obj, created = models.Species.objects.get_or_create(
-                defaults={'english_name': str(row["species"].strip())},
-                english_name__iexact=str(row["species"].strip())
-            )
-
-            week_obj, created = models.Week.objects.get_or_create(
-                week_number=row["sw"].strip()
-            )
-            created, _ = models.Score.objects.get_or_create(
-                hexagon=hexagon_obj,
-                species=species_obj,
-                week=week_obj,
-                # site_score=row["ss.std"].strip(),
-                # ceu_score=row["ceu"].strip(),
-                fs_score=row["fs"].strip(),
-            )
-            count_success += 1
-        except Exception as e:
-            errors.append(f"❌ error inserting line {row} : {e}")
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SCORE_STAGING_TABLE_SQL)
+        rows = []
+        for line, row in enumerate(reader, start=1):
+            if progress and line % IMPORT_PROGRESS_INTERVAL == 0:
+                progress(line, count_success + len(rows), errors)
+            try:
+                grid_id, species, week_number, fs_score = parse_score_row(row)
+                if grid_id not in context.hexagons:
+                    raise ValueError(f"there is no hexagon {grid_id}")
+            except Exception as e:
+                errors.append(f"❌ error inserting line {row} : {e}")
+                continue
+            rows.append((reader.line_num, grid_id, species, week_number, fs_score))
+            if len(rows) == SCORE_COPY_BATCH_SIZE:
+                copy_score_rows(cursor, rows, context)
+                count_success += len(rows)
+                rows = []
+        if rows:
+            copy_score_rows(cursor, rows, context)
+            count_success += len(rows)
+
+        cursor.execute(SCORE_STAGING_UPSERT_SQL)
+        species_ids = cursor.fetchone()[0]
+
+    refresh_species_score_stats(species_ids=species_ids)
+    bump_score_version()
 
     return {
         "count_success": count_success,
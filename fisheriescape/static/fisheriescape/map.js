@@ -65,9 +65,9 @@ function removeInfoNafo() {
 }
 
 
-// Create Lobster polygon layer and use onEachFeature to show certain info for each feature
+// Create Lobster polygon layer (its data is fetched below) and use onEachFeature to show certain info for each feature
 
-var lobsterFishery = L.geoJSON(lobsterObj, {
+var lobsterFishery = L.geoJSON(null, {
     style: function() {
         return {
             color: 'blue'
@@ -85,7 +85,7 @@ var lobsterFishery = L.geoJSON(lobsterObj, {
 
 // Create Snowcrab polygon layer and use onEachFeature to show certain info for each feature
 
-var snowCrabFishery = L.geoJSON(snowCrabObj, {
+var snowCrabFishery = L.geoJSON(null, {
     style: function() {
         return {
             color: 'yellow'
@@ -103,7 +103,7 @@ var snowCrabFishery = L.geoJSON(snowCrabObj, {
 
 // Create Herring polygon layer and use onEachFeature to show certain info for each feature
 
-var herringFishery = L.geoJSON(herringObj, {
+var herringFishery = L.geoJSON(null, {
     style: function() {
         return {
             color: 'red'
@@ -121,7 +121,7 @@ var herringFishery = L.geoJSON(herringObj, {
 
 // Create Groundfish polygon layer and use onEachFeature to show certain info for each feature
 
-var groundfishFishery = L.geoJSON(groundfishObj, {
+var groundfishFishery = L.geoJSON(null, {
     style: function() {
         return {
             color: 'grey'
@@ -139,7 +139,7 @@ var groundfishFishery = L.geoJSON(groundfishObj, {
 
 // Create NAFO Subareas polygon layer and use onEachFeature to show certain info for each feature
 
-var nafoSubFishery = L.geoJSON(nafoSubObj, {
+var nafoSubFishery = L.geoJSON(null, {
     style: function() {
         return {
             color: 'orange'
@@ -157,7 +157,7 @@ var nafoSubFishery = L.geoJSON(nafoSubObj, {
 
 // Create NAFO polygon layer and use onEachFeature to show certain info for each feature
 
-var nafoFishery = L.geoJSON(nafoObj, {
+var nafoFishery = L.geoJSON(null, {
     style: function() {
         return {
             color: 'green'
@@ -195,4 +195,18 @@ var overlayMaps = {
 
 // Create the control layer box and add baseMaps and overlayMaps to it
 
-L.control.layers(baseMaps, overlayMaps).addTo(map);
\ No newline at end of file
+L.control.layers(baseMaps, overlayMaps).addTo(map);
+
+
+// Fill the area layers from the api, the page itself holds no geometry
+
+fetch(areaLayersUrl, {credentials: 'same-origin'})
+    .then(response => response.json())
+    .then(areaLayers => {
+        lobsterFishery.addData(areaLayers.lobster_areas);
+        snowCrabFishery.addData(areaLayers.snow_crab_areas);
+        herringFishery.addData(areaLayers.herring_areas);
+        groundfishFishery.addData(areaLayers.groundfish_areas);
+        nafoSubFishery.addData(areaLayers.nafo_sub_areas);
+        nafoFishery.addData(areaLayers.nafo_areas);
+    });
@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.db import connections, transaction
+from django.utils import timezone
+
+from fisheriescape import models
+from fisheriescape.api.payloads import get_score_feature_payload, get_combined_score_feature_payload
+from fisheriescape.caching import get_most_requested_combined_species
+from fisheriescape.cube import build_score_cube, get_score_cube
+
+logger = get_task_logger(__name__)
+
+# number of layers rendered at the same time, each one uses a database connection
+WARMING_WORKERS = 3
+
+
+def warm_layer(name, get_payload, kwargs, in_thread=False):
+    """Render a layer into the cache (if it is not already there) and time it"""
+    start = time.perf_counter()
+    try:
+        get_payload(**kwargs)
+        error = None
+    except Exception as e:
+        error = str(e)
+    finally:
+        if in_thread:
+            # nothing else closes the database connection of a thread of the pool
+            connections.close_all()
+    seconds = round(time.perf_counter() - start, 3)
+    if error:
+        logger.error(f"❌ {name}: {error}")
+    else:
+        logger.info(f"✅ {name}: {seconds}s")
+    return {"layer": name, "seconds": seconds, "error": error}
+
+
+@shared_task(name="warm_score_cache")
+def warm_score_cache(combined_species_sets=10, workers=WARMING_WORKERS):
+    """
+    Render every species/week score layer of ScoreFeatureView into the cache, and every week of the most requested
+    combined species sets of ScoreFeatureCombinedView, so that no user waits for the first rendering of a layer after
+    an import or a deploy. Layers already cached are left as they are. The layers are rendered by this task itself,
+    never served stale and revalidated in the background.
+    :param combined_species_sets: number of combined species sets to warm, 0 for none
+    :param workers: number of layers rendered in parallel
+    """
+    layers = []
+    species_weeks = models.Score.objects.values_list('species__english_name', 'week__week_number') \
+        .distinct().order_by('species__english_name', 'week__week_number')
+    for species, week in species_weeks:
+        layers.append((f"{species} week {week}", get_score_feature_payload,
+                       {"species": species, "week": week, "serve_stale": False}))
+
+    if combined_species_sets:
+        weeks = models.Score.objects.values_list('week__week_number', flat=True).distinct() \
+            .order_by('week__week_number')
+        for species in get_most_requested_combined_species(combined_species_sets):
+            for week in weeks:
+                layers.append((f"{' + '.join(species)} week {week}", get_combined_score_feature_payload,
+                               {"species": species, "week": week, "serve_stale": False}))
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda layer: warm_layer(*layer, in_thread=True), layers))
+    else:
+        results = [warm_layer(*layer) for layer in layers]
+    logger.info(f"{len(results)} score layers warmed in {round(time.perf_counter() - start, 3)}s")
+    return results
+
+
+@shared_task(name="refresh_score_cube")
+def refresh_score_cube():
+    """Build a new score cube (see cube.build_score_cube) unless the current one is of the current score version"""
+    if get_score_cube() is not None:
+        return None
+    start = time.perf_counter()
+    index = build_score_cube()
+    logger.info(f"score cube of score version {index['score_version']} built in "
+                f"{round(time.perf_counter() - start, 3)}s")
+    return index["build"]
+
+
+def queue_score_refresh():
+    """Queue the tasks rendering what is derived from the scores, once the current transaction (if any) commits"""
+    transaction.on_commit(refresh_score_cube.delay)
+    transaction.on_commit(warm_score_cache.delay)
+
+
+@shared_task(name="run_import_job")
+def run_import_job(job_id, warm=True):
+    """
+    Import the csv file of an ImportJob, publishing its progress as it goes (see models.ImportJob.get_progress). The
+    score layers and the score cube are refreshed after a score import.
+    :param warm: whether to queue the refresh of the score layers and cube after a score import, see
+    queue_score_refresh
+    """
+    # scripts dispatches the tasks of this module
+    from fisheriescape import scripts
+    import_from_reader = {
+        "scores": scripts.import_scores_from_reader,
+        "vulnerable_species_spots": scripts.import_vulnerable_species_from_reader,
+    }
+
+    job = models.ImportJob.objects.get(pk=job_id)
+    job.status = "running"
+    job.started_at = timezone.now()
+    job.save()
+    try:
+        with job.file.open("rb") as file:
+            result = import_from_reader[job.kind](scripts.get_upload_reader(file), progress=job.set_progress)
+        job.status = "succeeded"
+        job.count_success = result["count_success"]
+        job.errors = result["errors"]
+        job.rows_processed = result["count_success"] + len(result["errors"])
+    except Exception as e:
+        logger.exception(f"import job {job_id} failed")
+        job.status = "failed"
+        job.errors = [*job.errors, f"❌ {e}"]
+    job.finished_at = timezone.now()
+    job.save()
+
+    if job.kind == "scores" and job.status == "succeeded":
+        if warm:
+            queue_score_refresh()
+    return job.status
@@ -1,11 +1,22 @@
 import os
 
+from django.conf import settings
+from django.test import override_settings
+
 from shared_models.test.common_tests import CommonTest
 
 fixtures_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures')
 standard_fixtures = [file for file in os.listdir(fixtures_dir)]
 
 
+# the tests run without redis: the database cache is rolled back with each test, as the rest of their data
+DATABASE_CACHE = {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'cache',
+}
+
+
 # here are common tests for Fisheriescape. Essentially they will just load the fisheriescape fixtures
+@override_settings(CACHES={**settings.CACHES, 'default': DATABASE_CACHE, 'database': DATABASE_CACHE})
 class CommonFisheriescapeTest(CommonTest):
     fixtures = standard_fixtures
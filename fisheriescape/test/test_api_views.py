@@ -1,13 +1,34 @@
+import csv
+import gzip
+import io
+import json
+import struct
+import tempfile
+
+from django.core.files.base import ContentFile
 from rest_framework.generics import ListAPIView
+from rest_framework.views import APIView
 from rest_framework.reverse import reverse_lazy
-from django.test import tag
+from django.test import tag, override_settings
 
+from fisheriescape import cube, load, models, scripts
+from fisheriescape.caching import bump_data_version
 from fisheriescape.api import views
 from fisheriescape.test import FactoryFloor
 from fisheriescape.test.common_tests import CommonFisheriescapeTest as CommonTest
 
 TEST_SPECIES = ["American Lobster","Snow Crab","Atlantic Halibut"]
 TEST_WEEK = 30
+# around hexagon 313 (OO-293) only
+TEST_BBOX = "-62.0,47.4,-61.8,47.7"
+TEST_POLYGON = "POLYGON ((-62 47.4, -61.8 47.4, -61.8 47.7, -62 47.7, -62 47.4))"
+
+
+def get_decimals(feature_collection):
+    """ the most decimals of the coordinates of a feature collection of polygons """
+    coordinates = [coordinate for feature in feature_collection["features"]
+                   for ring in feature["geometry"]["coordinates"] for point in ring for coordinate in point]
+    return max(len(repr(coordinate).partition(".")[2]) for coordinate in coordinates)
 
 
 class TestScoreFeatureView(CommonTest):
@@ -35,6 +56,71 @@ class TestScoreFeatureView(CommonTest):
         response = self.client.get(self.test_url)
         self.assert_dict_has_keys(response.json(), ["type", "max_fs_score", "features"])
 
+    @tag("ScoreFeature", "score_feature", "correct_response")
+    def test_correct_compressed_response(self):
+        params = {"species": TEST_SPECIES[2], "week": TEST_WEEK}
+        response = self.client.get(self.test_url, params, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), self.client.get(self.test_url, params).json())
+
+    @tag("ScoreFeature", "score_feature", "correct_response")
+    def test_correct_streamed_response(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "stream": "true"})
+        self.assertTrue(response.streaming)
+        feature_collection = json.loads(b"".join(response.streaming_content))
+        expected = self.client.get(self.test_url, {"species": TEST_SPECIES[2]}).json()
+        self.assertEqual(feature_collection["max_fs_score"], expected["max_fs_score"])
+        self.assertEqual(sorted(feature["id"] for feature in feature_collection["features"]),
+                         sorted(feature["id"] for feature in expected["features"]))
+
+    @tag("ScoreFeature", "score_feature", "precision")
+    def test_precision(self):
+        params = {"species": TEST_SPECIES[2], "week": TEST_WEEK, "precision": 2}
+
+        self.assertGreater(get_decimals(self.client.get(self.test_url, {**params, "precision": 9}).json()), 2)
+        self.assertLessEqual(get_decimals(self.client.get(self.test_url, params).json()), 2)
+        response = self.client.get(self.test_url, {**params, "stream": "true"})
+        self.assertLessEqual(get_decimals(json.loads(b"".join(response.streaming_content))), 2)
+
+    @tag("ScoreFeature", "score_feature", "validation")
+    def test_invalid_week(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "week": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    @tag("ScoreFeature", "score_feature", "spatial_filter")
+    def test_spatial_filters(self):
+        params = {"species": TEST_SPECIES[2], "week": TEST_WEEK}
+        self.assertEqual(len(self.client.get(self.test_url, params).json().get('features')), 2)
+        # only hexagon 313 (OO-293)
+        response = self.client.get(self.test_url, {**params, "bbox": TEST_BBOX})
+        self.assertEqual([feature["properties"]["grid_id"] for feature in response.json().get('features')],
+                         ["OO-293"])
+        response = self.client.post(f"{self.test_url}?species={TEST_SPECIES[2]}&week={TEST_WEEK}",
+                                    {"polygon": TEST_POLYGON})
+        self.assertEqual(len(response.json().get('features')), 1)
+        load.hexagon_area_overlaps_run()
+        nafo_area = models.NAFOArea.objects.get(name="4T")
+        response = self.client.get(self.test_url, {**params, "nafo_area": nafo_area.id})
+        self.assertEqual(len(response.json().get('features')), 2)
+
+    @tag("ScoreFeature", "score_feature", "validation")
+    def test_spatial_filter_validation(self):
+        self.assertEqual(self.client.get(self.test_url, {"bbox": "-62,47"}).status_code, 400)
+        self.assertEqual(self.client.get(self.test_url, {"fishery_area": "LFA 23"}).status_code, 400)
+        self.assertEqual(self.client.post(self.test_url, {"polygon": "POINT (-61.9 47.5)"}).status_code, 400)
+
+    @tag("ScoreFeature", "score_feature", "correct_response")
+    def test_correct_binary_response(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "week": TEST_WEEK, "format": "binary"})
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        header_length = struct.unpack("<I", response.content[:4])[0]
+        header = json.loads(response.content[4:4 + header_length])
+        self.assertEqual([column["name"] for column in header["columns"]],
+                         ["hexagon", "species", "week", "fs_score", "site_score", "ceu_score"])
+        self.assertEqual(header["columns"][0]["length"], 2)
+        self.assertEqual(len(response.content), 4 + header_length + 6 * 2 * 4)
+
 
 class TestScoreFeatureCombinedView(CommonTest):
     def setUp(self):
@@ -60,7 +146,366 @@ class TestScoreFeatureCombinedView(CommonTest):
     def test_correct_response(self):
         response = self.client.get(self.test_url,{"species": TEST_SPECIES, "week": TEST_WEEK}, content_type='application/json')
         self.assert_dict_has_keys(response.json(), ["type", "max_fs_score", "features"])
-        self.assertEqual(len(response.data.get('features')),2,)
+        self.assertEqual(len(response.json().get('features')), 2, )
+
+    @tag("ScoreFeature", "score_feature", "correct_response")
+    def test_correct_simplified_response(self):
+        load.simplify_polygons_run(layers=["hexagon"])
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES, "week": TEST_WEEK, "zoom": 5,
+                                                   "precision": 3})
+        self.assertEqual(len(response.json().get('features')), 2, )
+        coordinate = response.json().get('features')[0]["geometry"]["coordinates"][0][0][0]
+        self.assertEqual(coordinate, [round(value, 3) for value in coordinate])
+
+    @tag("ScoreFeature", "score_feature", "precision")
+    def test_precision(self):
+        params = {"species": TEST_SPECIES[2], "week": TEST_WEEK, "precision": 2}
+
+        self.assertGreater(get_decimals(self.client.get(self.test_url, {**params, "precision": 9}).json()), 2)
+        self.assertLessEqual(get_decimals(self.client.get(self.test_url, params).json()), 2)
+
+    @tag("ScoreFeature", "score_feature", "spatial_filter")
+    def test_spatial_filters(self):
+        params = {"species": TEST_SPECIES, "week": TEST_WEEK}
+        response = self.client.get(self.test_url, {**params, "bbox": TEST_BBOX})
+        self.assertEqual([feature["properties"]["grid_id"] for feature in response.json().get('features')],
+                         ["OO-293"])
+        response = self.client.post(f"{self.test_url}?week={TEST_WEEK}&species={'&species='.join(TEST_SPECIES)}",
+                                    {"polygon": TEST_POLYGON})
+        self.assertEqual(len(response.json().get('features')), 1)
+
+    # the background revalidation thread would not see the data of the test transaction
+    @override_settings(FISHERIESCAPE_STALE_WHILE_REVALIDATE=False)
+    @tag("ScoreFeature", "score_feature", "conditional_response")
+    def test_not_modified_response(self):
+        params = {"species": TEST_SPECIES, "week": TEST_WEEK}
+        response = self.client.get(self.test_url, params)
+        self.assertIn("no-cache", response["Cache-Control"])
+        response = self.client.get(self.test_url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        # a new data version (e.g. after an import) changes the ETag
+        bump_data_version()
+        response = self.client.get(self.test_url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+
+class TestScoreTileView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.test_url = reverse_lazy('api:scores-tiles', kwargs={"z": 0, "x": 0, "y": 0})
+        self.user = self.get_and_login_user()
+
+    @tag("ScoreTile", "score_tile", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.ScoreTileView, APIView)
+        self.assert_inheritance(views.ScoreTileView, views.FisheriescapeAccessRequired)
+
+    @tag("ScoreTile", "score_tile", "access")
+    def test_view(self):
+        self.assert_good_response(self.test_url)
+
+    @tag("ScoreTile", "score_tile", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:scores-tiles', f"/api/fisheriescape/scores-tiles/0/0/0.mvt",
+                                test_url_args=[0, 0, 0])
+
+    @tag("ScoreTile", "score_tile", "correct_response")
+    def test_correct_response(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[0], "week": TEST_WEEK})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertTrue(len(response.content) > 0)
+        response = self.client.get(self.test_url, {"week": TEST_WEEK})
+        self.assertEqual(response.status_code, 400)
+
+    @tag("ScoreTile", "score_tile", "validation")
+    def test_invalid_week(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[0], "week": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestHexagonGridView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.test_url = reverse_lazy('api:hexagon-grid')
+        self.user = self.get_and_login_user()
+
+    @tag("HexagonGrid", "hexagon_grid", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.HexagonGridView, APIView)
+        self.assert_inheritance(views.HexagonGridView, views.FisheriescapeAccessRequired)
+
+    @tag("HexagonGrid", "hexagon_grid", "access")
+    def test_view(self):
+        self.assert_good_response(self.test_url)
+
+    @tag("HexagonGrid", "hexagon_grid", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:hexagon-grid', f"/api/fisheriescape/hexagon-grid/")
+
+    @tag("HexagonGrid", "hexagon_grid", "correct_response")
+    def test_correct_response(self):
+        response = self.client.get(self.test_url)
+        self.assert_dict_has_keys(response.json(), ["type", "version", "features"])
+        self.assertEqual(len(response.json().get('features')), 3)
+        self.assertIn("no-cache", response["Cache-Control"])
+        response = self.client.get(self.test_url, {"v": response.json().get('version')})
+        self.assertIn("immutable", response["Cache-Control"])
+
+
+class TestScoreValuesView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.test_url = reverse_lazy('api:scores-values')
+        self.user = self.get_and_login_user()
+
+    @tag("ScoreValues", "score_values", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.ScoreValuesView, APIView)
+        self.assert_inheritance(views.ScoreValuesView, views.FisheriescapeAccessRequired)
+
+    @tag("ScoreValues", "score_values", "access")
+    def test_view(self):
+        self.assert_good_response(self.test_url)
+
+    @tag("ScoreValues", "score_values", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:scores-values', f"/api/fisheriescape/scores-values/")
+
+    @tag("ScoreValues", "score_values", "correct_response")
+    def test_correct_response(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "week": TEST_WEEK})
+        self.assert_dict_has_keys(response.json(), ["version", "format", "max_fs_score", "values"])
+        self.assertEqual(len(response.json().get('values')), 2)
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "week": TEST_WEEK, "format": "dense"})
+        self.assertEqual(response.json().get('values'), [None, 2.2441, 2.2441])
+
+    @tag("ScoreValues", "score_values", "validation")
+    def test_invalid_week(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "week": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    @tag("ScoreValues", "score_values", "score_cube")
+    def test_cube_values(self):
+        # the only score of hexagon 311 has no fs_score: neither the database nor the cube give it a value
+        models.Score.objects.create(hexagon_id=311, species=models.Species.objects.get(english_name="Snow Crab"),
+                                    week=models.Week.objects.get(week_number=TEST_WEEK))
+        params = {"species": TEST_SPECIES, "week": TEST_WEEK}
+        with tempfile.TemporaryDirectory() as directory, override_settings(FISHERIESCAPE_SCORE_CUBE_DIR=directory):
+            pairs = self.client.get(self.test_url, params).json()["values"]
+            dense = self.client.get(self.test_url, {**params, "format": "dense"}).json()["values"]
+            cube.build_score_cube()
+            # a new cache key, the cube stays valid
+            bump_data_version()
+            self.assertIsNotNone(cube.get_score_cube())
+            self.assertEqual(self.client.get(self.test_url, params).json()["values"], pairs)
+            self.assertEqual(self.client.get(self.test_url, {**params, "format": "dense"}).json()["values"], dense)
+        self.assertEqual(pairs, [[312, 2.2441], [313, 3.3662]])
+        self.assertEqual(dense, [None, 2.2441, 3.3662])
+
+
+class TestScoreTimeseriesView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.instance = FactoryFloor.ScoreFactory()
+        self.test_url = reverse_lazy('api:scores-timeseries')
+        self.user = self.get_and_login_user()
+
+    @tag("ScoreTimeseries", "score_timeseries", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.ScoreTimeseriesView, APIView)
+        self.assert_inheritance(views.ScoreTimeseriesView, views.FisheriescapeAccessRequired)
+
+    @tag("ScoreTimeseries", "score_timeseries", "access")
+    def test_view(self):
+        self.assert_good_response(f"{self.test_url}?species={TEST_SPECIES[2]}")
+
+    @tag("ScoreTimeseries", "score_timeseries", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:scores-timeseries', f"/api/fisheriescape/scores-timeseries/")
+
+    @tag("ScoreTimeseries", "score_timeseries", "correct_response")
+    def test_correct_response(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2]})
+        self.assert_dict_has_keys(response.json(), ["weeks", "max_fs_score", "series"])
+        series = dict(response.json().get('series'))
+        # Atlantic Halibut is scored on weeks 28 and 30 of hexagon 313
+        self.assertEqual(len(series[313]), 53)
+        self.assertEqual(series[313][27], 0.3838)
+        self.assertEqual(series[313][29], 2.2441)
+        self.assertIsNone(series[313][0])
+
+    @tag("ScoreTimeseries", "score_timeseries", "correct_response")
+    def test_correct_binary_response(self):
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "format": "binary"})
+        header_length = struct.unpack("<I", response.content[:4])[0]
+        header = json.loads(response.content[4:4 + header_length])
+        columns = {column["name"]: column for column in header["columns"]}
+        self.assertEqual(columns["fs_score"]["length"], columns["hexagon"]["length"] * 53)
+
+    @tag("ScoreTimeseries", "score_timeseries", "validation")
+    def test_species_required(self):
+        self.assertEqual(self.client.get(self.test_url).status_code, 400)
+
+
+class TestMapAreaLayersView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.instance = FactoryFloor.FisheryAreaFactory()
+        self.test_url = reverse_lazy('api:map-area-layers')
+        self.user = self.get_and_login_user()
+
+    @tag("MapAreaLayers", "map_area_layers", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.MapAreaLayersView, APIView)
+        self.assert_inheritance(views.MapAreaLayersView, views.FisheriescapeAccessRequired)
+
+    @tag("MapAreaLayers", "map_area_layers", "access")
+    def test_view(self):
+        self.assert_good_response(self.test_url)
+
+    @tag("MapAreaLayers", "map_area_layers", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:map-area-layers', f"/api/fisheriescape/map-area-layers/")
+
+    @tag("MapAreaLayers", "map_area_layers", "correct_response")
+    def test_correct_response(self):
+        response = self.client.get(self.test_url, {"tolerance": 0.001, "precision": 5})
+        self.assert_dict_has_keys(response.json(), ["lobster_areas", "snow_crab_areas", "herring_areas",
+                                                    "groundfish_areas", "nafo_sub_areas", "nafo_areas"])
+        for feature_collection in response.json().values():
+            self.assertEqual(feature_collection["type"], "FeatureCollection")
+
+
+class TestHexagonProfileView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.test_url = reverse_lazy('api:hexagon-profile', kwargs={"grid_id": "OO-293"})
+        self.user = self.get_and_login_user()
+
+    @tag("HexagonProfile", "hexagon_profile", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.HexagonProfileView, APIView)
+        self.assert_inheritance(views.HexagonProfileView, views.FisheriescapeAccessRequired)
+
+    @tag("HexagonProfile", "hexagon_profile", "access")
+    def test_view(self):
+        self.assert_good_response(self.test_url)
+
+    @tag("HexagonProfile", "hexagon_profile", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:hexagon-profile', f"/api/fisheriescape/hexagon/OO-293/profile/",
+                                test_url_args=["OO-293"])
+
+    @tag("HexagonProfile", "hexagon_profile", "correct_response")
+    def test_correct_response(self):
+        load.hexagon_area_overlaps_run()
+        response = self.client.get(self.test_url)
+        self.assert_dict_has_keys(response.json(), ["grid_id", "scores", "fishery_areas", "nafo_areas",
+                                                    "vulnerable_species_spots"])
+        # hexagon 313 is scored for Lobster on week 30, Halibut on weeks 28 and 30 and Herring on week 28
+        scores = [(score["species"], score["week"]) for score in response.json().get('scores')]
+        self.assertEqual(scores, [("American Lobster", 30), ("Atlantic Halibut", 28), ("Atlantic Halibut", 30),
+                                  ("Atlantic Herring", 28)])
+        self.assertIn("4T", [area["name"] for area in response.json().get('nafo_areas')])
+        response = self.client.get(self.test_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    @tag("HexagonProfile", "hexagon_profile", "vulnerable_species_spots")
+    def test_imported_spot(self):
+        # a spot inside hexagon 313 (OO-293), through the importer of the csv files
+        csv_file = io.StringIO("year,date,SW,lat,lon,species,number\n2021,7/21/2021,30,47.525,-61.92,fin whale,3\n")
+        result = scripts.import_vulnerable_species_from_reader(csv.DictReader(csv_file))
+        self.assertFalse(result["errors"])
+        response = self.client.get(self.test_url)
+        spots = response.json().get('vulnerable_species_spots')
+        self.assertEqual([(spot["vulnerable_species"], spot["week"], spot["count"]) for spot in spots],
+                         [("Fin whale", 30, 3)])
+
+    @tag("HexagonProfile", "hexagon_profile", "validation")
+    def test_unknown_hexagon(self):
+        response = self.client.get(reverse_lazy('api:hexagon-profile', kwargs={"grid_id": "XX-000"}))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestZonalStatisticsView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.test_url = reverse_lazy('api:zonal-statistics')
+        self.user = self.get_and_login_user()
+
+    @tag("ZonalStatistics", "zonal_statistics", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.ZonalStatisticsView, APIView)
+        self.assert_inheritance(views.ZonalStatisticsView, views.FisheriescapeAccessRequired)
+
+    @tag("ZonalStatistics", "zonal_statistics", "access")
+    def test_view(self):
+        self.assert_good_response(f"{self.test_url}?species={TEST_SPECIES[2]}")
+
+    @tag("ZonalStatistics", "zonal_statistics", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:zonal-statistics', f"/api/fisheriescape/zonal-statistics/")
+
+    @tag("ZonalStatistics", "zonal_statistics", "correct_response")
+    def test_correct_response(self):
+        load.hexagon_area_overlaps_run()
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "layer": "nafo_area", "name": "4T",
+                                                   "week_from": 28, "week_to": TEST_WEEK})
+        self.assertEqual(len(response.json()), 1)
+        statistics = response.json()[0]
+        self.assert_dict_has_keys(statistics, ["pk", "name", "layer_id", "hexagon_count", "sum", "mean", "max",
+                                               "weighted_mean"])
+        self.assertEqual(statistics["max"], 2.2441)
+        # week 30 only
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "layer": "nafo_area", "name": "4T",
+                                                   "week_from": TEST_WEEK, "week_to": TEST_WEEK})
+        self.assertAlmostEqual(response.json()[0]["mean"], 2.2441)
+
+    @tag("ZonalStatistics", "zonal_statistics", "validation")
+    def test_validation(self):
+        self.assertEqual(self.client.get(self.test_url).status_code, 400)
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "layer": "hexagon"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.test_url, {"species": TEST_SPECIES[2], "week_from": "spring"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestImportJobView(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.instance = models.ImportJob.objects.create(kind="scores", file=ContentFile(b"", name="scores.csv"))
+        self.test_url = reverse_lazy('api:import-job', kwargs={"pk": self.instance.id})
+        self.user = self.get_and_login_user(in_group="fisheriescape_admin")
+
+    @tag("ImportJob", "import_job", "view")
+    def test_view_class(self):
+        self.assert_inheritance(views.ImportJobView, APIView)
+        self.assert_inheritance(views.ImportJobView, views.FisheriescapeAdminAccessRequired)
+
+    @tag("ImportJob", "import_job", "access")
+    def test_view(self):
+        self.assert_good_response(self.test_url)
+
+    @tag("ImportJob", "import_job", "correct_url")
+    def test_correct_url(self):
+        self.assert_correct_url('api:import-job', f"/api/fisheriescape/import-jobs/{self.instance.id}/",
+                                test_url_args=[self.instance.id])
+
+    @tag("ImportJob", "import_job", "correct_response")
+    def test_correct_response(self):
+        response = self.client.get(self.test_url)
+        self.assertEqual(response.json()["status"], "pending")
+        # a running job reports the progress its worker keeps in the cache
+        self.instance.status = "running"
+        self.instance.save()
+        self.instance.set_progress(rows_processed=2000, count_success=1999, errors=["Line 12: bad row"])
+        response = self.client.get(self.test_url)
+        self.assert_dict_has_keys(response.json(), ["status", "rows_processed", "rows_per_second", "count_success",
+                                                    "error_count", "errors"])
+        self.assertEqual(response.json()["rows_processed"], 2000)
+        self.assertEqual(response.json()["error_count"], 1)
+        self.assertIn("no-store", response["Cache-Control"])
 
 
 class TestVulnerableSpeciesView(CommonTest):
@@ -88,6 +533,13 @@ class TestVulnerableSpeciesView(CommonTest):
         response = self.client.get(self.test_url)
         self.assert_dict_has_keys(response.json()[0], ["english_name", "french_name", "latin_name", "website"])
 
+    @tag("VulnerableSpecies", "vulnerable_species", "conditional_response")
+    def test_not_modified_response(self):
+        response = self.client.get(self.test_url)
+        self.assertIn("max-age", response["Cache-Control"])
+        response = self.client.get(self.test_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
 
 class TestVulnerableSpeciesSpotsView(CommonTest):
     def setUp(self):
@@ -113,3 +565,11 @@ class TestVulnerableSpeciesSpotsView(CommonTest):
     def test_correct_response(self):
         response = self.client.get(self.test_url)
         self.assert_dict_has_keys(response.json()[0], ["count", "vulnerable_species", "week", "point"])
+
+    @tag("VulnerableSpeciesSpots", "vulnerable_species_spots", "correct_response")
+    def test_correct_streamed_response(self):
+        response = self.client.get(self.test_url, {"stream": "true"})
+        self.assertTrue(response.streaming)
+        spots = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(spots), len(self.client.get(self.test_url).json()))
+        self.assert_dict_has_keys(spots[0], ["count", "vulnerable_species", "week", "point"])
@@ -0,0 +1,170 @@
+import gzip
+import pickle
+from threading import Timer
+from unittest import mock
+
+from django.test import tag, RequestFactory, SimpleTestCase, override_settings
+
+from dm_apps.cache_backends import CompressedRedisSerializer, TieredRedisCache
+from dm_apps.default_conf import REDIS_CACHE
+from fisheriescape import caching
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fisheriescape-test',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestCacheKeys(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_score_cache().clear()
+
+    @tag("caching", "cache_key")
+    def test_canonical_params(self):
+        self.assertEqual(
+            caching.get_cache_key("scores-feature-combined", species=["Snow Crab", "American Lobster"], week="30"),
+            caching.get_cache_key("scores-feature-combined", week="30", species=["American Lobster", "Snow Crab"]),
+        )
+
+    @tag("caching", "cache_key")
+    def test_namespaces(self):
+        self.assertNotEqual(
+            caching.get_cache_key("scores-feature", species="Snow Crab", week="30"),
+            caching.get_cache_key("scores-feature-combined", species=["Snow Crab"], week="30"),
+        )
+
+    @tag("caching", "data_version")
+    def test_bump_data_version(self):
+        cache_key = caching.get_cache_key("scores-feature", species="Snow Crab", week="30")
+        self.assertEqual(cache_key, caching.get_cache_key("scores-feature", species="Snow Crab", week="30"))
+        caching.bump_data_version()
+        self.assertNotEqual(cache_key, caching.get_cache_key("scores-feature", species="Snow Crab", week="30"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestGetOrCompute(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        caching.get_score_cache().clear()
+        self.cache_key = caching.get_cache_key("scores-feature", species="Snow Crab", week="30")
+        self.computed = []
+
+    def compute(self):
+        self.computed.append(self.cache_key)
+        return {"cache_key": self.cache_key}
+
+    @tag("caching", "single_flight")
+    def test_computed_once(self):
+        for i in range(3):
+            self.assertEqual(caching.get_or_compute(self.cache_key, self.compute), {"cache_key": self.cache_key})
+        self.assertEqual(len(self.computed), 1)
+        caching.get_or_compute(self.cache_key, self.compute, refresh=True)
+        self.assertEqual(len(self.computed), 2)
+
+    @tag("caching", "single_flight")
+    def test_wait_for_other_worker(self):
+        # another worker computes the key and caches it while this one waits
+        cache = caching.get_score_cache()
+        cache.add(f"{self.cache_key}:lock", 1)
+        Timer(0.2, cache.set, args=(self.cache_key, {"cache_key": "other worker"})).start()
+        self.assertEqual(caching.get_or_compute(self.cache_key, self.compute), {"cache_key": "other worker"})
+        self.assertFalse(self.computed)
+
+    @tag("caching", "stale_while_revalidate")
+    def test_stale_while_revalidate(self):
+        stale_payload = caching.get_or_compute(self.cache_key, self.compute)
+        caching.bump_data_version()
+        self.cache_key = caching.get_cache_key("scores-feature", species="Snow Crab", week="30")
+        # another worker is computing the new version, the previous one is served meanwhile
+        caching.get_score_cache().add(f"{self.cache_key}:lock", 1)
+        self.assertEqual(caching.get_or_compute(self.cache_key, self.compute), stale_payload)
+        self.assertEqual(len(self.computed), 1)
+
+    @tag("caching", "stale_while_revalidate")
+    def test_revalidated_in_the_background(self):
+        stale_payload = caching.get_or_compute(self.cache_key, self.compute)
+        caching.bump_data_version()
+        self.cache_key = caching.get_cache_key("scores-feature", species="Snow Crab", week="30")
+        with mock.patch.object(caching, "_revalidation_executor") as revalidation_executor:
+            self.assertEqual(caching.get_or_compute(self.cache_key, self.compute), stale_payload)
+            revalidation_executor.submit.assert_called_once()
+            # the lock is held until the revalidation is done
+            self.assertEqual(caching.get_or_compute(self.cache_key, self.compute), stale_payload)
+            revalidation_executor.submit.assert_called_once()
+        caching.get_score_cache().delete(f"{self.cache_key}:lock")
+        caching._pending_revalidations.release()
+        # computed here, without a stale payload
+        self.assertEqual(caching.get_or_compute(self.cache_key, self.compute, serve_stale=False),
+                         {"cache_key": self.cache_key})
+        self.assertEqual(len(self.computed), 2)
+
+
+class TestCompressedRedisSerializer(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.serializer = CompressedRedisSerializer()
+
+    @tag("caching", "serializer")
+    def test_round_trip(self):
+        small_payload = {"type": "FeatureCollection", "features": []}
+        large_payload = {"type": "FeatureCollection", "features": [{"id": i, "fs_score": 1.5} for i in range(1000)]}
+        for payload in [small_payload, large_payload, b"\x00" * 5000, "Snow Crab"]:
+            self.assertEqual(self.serializer.loads(self.serializer.dumps(payload)), payload)
+
+    @tag("caching", "serializer")
+    def test_compression(self):
+        payload = {"type": "FeatureCollection", "features": [{"id": i, "fs_score": 1.5} for i in range(1000)]}
+        self.assertLess(len(self.serializer.dumps(payload)), len(pickle.dumps(payload)) / 2)
+
+    @tag("caching", "serializer")
+    def test_integers_are_not_pickled(self):
+        # redis INCR needs the raw integer
+        self.assertEqual(self.serializer.dumps(42), 42)
+        self.assertEqual(self.serializer.loads(b"43"), 43)
+
+
+class TestCompressedResponses(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = b'{"type": "FeatureCollection", "features": []}'
+        self.payload = caching.compress_payload(self.content)
+
+    @tag("caching", "compressed_response")
+    def test_accepted_encodings(self):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip;q=1.0, br;q=0, identity")
+        self.assertEqual(caching.get_accepted_encodings(request), {"gzip", "identity"})
+
+    @tag("caching", "compressed_response")
+    def test_gzip_response(self):
+        response = caching.get_compressed_response(RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip"), self.payload)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.content)
+
+    @tag("caching", "compressed_response")
+    def test_identity_response(self):
+        response = caching.get_compressed_response(RequestFactory().get("/"), self.payload)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, self.content)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestTieredRedisCache(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        # never connects: only the keys it would keep in memory are looked at
+        self.cache = TieredRedisCache(REDIS_CACHE["LOCATION"], REDIS_CACHE)
+
+    @tag("caching", "tiered_cache")
+    def test_only_versioned_payloads_are_kept_locally(self):
+        cache_key = caching.get_cache_key("scores-feature", species="Snow Crab", week="30")
+        self.assertTrue(self.cache.keeps_locally(cache_key))
+        # overwritten keys, which other processes must see at once
+        self.assertFalse(self.cache.keeps_locally(caching.DATA_VERSION_KEY))
+        self.assertFalse(self.cache.keeps_locally(caching.COMBINED_SPECIES_KEY))
+        self.assertFalse(self.cache.keeps_locally(caching.get_stale_key(cache_key)))
+        self.assertFalse(self.cache.keeps_locally(f"{cache_key}:lock"))
+        self.assertFalse(self.cache.keeps_locally("fisheriescape:import-job:1"))
@@ -0,0 +1,49 @@
+import math
+import tempfile
+
+from django.test import tag, override_settings
+
+from fisheriescape import cube
+from fisheriescape.caching import bump_data_version, bump_score_version
+from fisheriescape.test.common_tests import CommonFisheriescapeTest as CommonTest
+
+
+class TestScoreCube(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    @tag("Score", "score_cube", "build")
+    def test_build_score_cube(self):
+        with override_settings(FISHERIESCAPE_SCORE_CUBE_DIR=self.directory.name):
+            index = cube.build_score_cube()
+            score_cube = cube.get_score_cube()
+        self.assertEqual(score_cube.score_version, index["score_version"])
+        self.assertEqual(list(score_cube.hexagon_ids), [311, 312, 313])
+        self.assertEqual(score_cube.scores.shape, (len(index["species"]), 53, 3))
+
+    @tag("Score", "score_cube", "values")
+    def test_week_values(self):
+        with override_settings(FISHERIESCAPE_SCORE_CUBE_DIR=self.directory.name):
+            cube.build_score_cube()
+            score_cube = cube.get_score_cube()
+        values = score_cube.get_week_values(["American Lobster", "Atlantic Halibut"], 30)
+        self.assertTrue(math.isnan(values[0]))
+        self.assertAlmostEqual(values[1], 2.2441, places=4)
+        self.assertAlmostEqual(values[2], 1.1221 + 2.2441, places=4)
+        self.assertTrue(all(math.isnan(value) for value in score_cube.get_week_values(["Atlantic Halibut"], 54)))
+
+        columns = score_cube.get_timeseries_columns(["Atlantic Halibut"])
+        self.assertEqual(list(columns["hexagon"]), [312, 313])
+        self.assertAlmostEqual(columns["fs_score"][53 + 27], 0.3838, places=4)
+
+    @tag("Score", "score_cube", "version")
+    def test_out_of_date(self):
+        with override_settings(FISHERIESCAPE_SCORE_CUBE_DIR=self.directory.name):
+            cube.build_score_cube()
+            # spots and polygons do not change the cube
+            bump_data_version()
+            self.assertIsNotNone(cube.get_score_cube())
+            bump_score_version()
+            self.assertIsNone(cube.get_score_cube())
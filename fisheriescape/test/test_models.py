@@ -2,7 +2,7 @@ from django.urls import reverse_lazy
 from django.test import tag
 
 import shared_models
-from fisheriescape import models
+from fisheriescape import load, models
 from fisheriescape.test import FactoryFloor
 from fisheriescape.test.common_tests import CommonFisheriescapeTest as CommonTest
 from faker import Faker
@@ -261,3 +261,35 @@ class TestFisheryModel(CommonTest):
             'species',
         ]
         self.assert_mandatory_fields(models.Fishery, fields_to_check)
+
+
+class TestHexagonAreaOverlapModel(CommonTest):
+    def setUp(self):
+        super().setUp()
+        load.hexagon_area_overlaps_run()
+
+    @tag('HexagonAreaOverlap', 'models', 'fields')
+    def test_fields(self):
+        fields_to_check = [
+            "hexagon",
+            "fishery_area",
+            "nafo_area",
+            "overlap_fraction",
+        ]
+        self.assert_has_fields(models.HexagonAreaOverlap, fields_to_check)
+
+    @tag('HexagonAreaOverlap', 'models', 'refresh')
+    def test_refresh(self):
+        # every fixture hexagon is in a NAFO area
+        nafo_overlaps = models.HexagonAreaOverlap.objects.filter(nafo_area__isnull=False)
+        self.assertEqual(nafo_overlaps.values("hexagon").distinct().count(), 3)
+        for overlap in models.HexagonAreaOverlap.objects.all():
+            self.assertTrue(0 < overlap.overlap_fraction <= 1)
+
+        # the overlaps of the other layers are left as they are
+        fishery_overlap_count = models.HexagonAreaOverlap.objects.filter(fishery_area__isnull=False).count()
+        models.NAFOArea.objects.filter(name="4T").delete()
+        load.hexagon_area_overlaps_run(layers=["nafo_area"])
+        self.assertFalse(models.HexagonAreaOverlap.objects.filter(nafo_area__name="4T").exists())
+        self.assertEqual(models.HexagonAreaOverlap.objects.filter(fishery_area__isnull=False).count(),
+                         fishery_overlap_count)
@@ -1,17 +1,30 @@
+import csv
+import io
 import os
+import tempfile
+from unittest import mock
 
 from rest_framework.generics import ListAPIView
 from rest_framework.reverse import reverse_lazy
+from django.core.files.base import ContentFile
 from django.test import tag
 
 from fisheriescape.api import views
 from fisheriescape.test import FactoryFloor
 from fisheriescape.test.common_tests import CommonFisheriescapeTest as CommonTest
-from fisheriescape import scripts
-from fisheriescape.models import Score, VulnerableSpeciesSpot
+from fisheriescape import scripts, tasks
+from django.db.models import Max
+
+from fisheriescape.models import Score, VulnerableSpeciesSpot, SpeciesScoreStats, Week, Hexagon, Species
 
 TEST_SCORES_FOLDER = os.path.join(os.path.dirname(__file__), 'test_data','scores')
 TEST_VULNERABLE_SPECIES_SPOTS_FOLDER = os.path.join(os.path.dirname(__file__), 'test_data','vulnerable_species_spots')
+TEST_SCORES_CSV = (
+    b'"grid.id","species","sw","fs"\n'
+    b'"OT-354","Atlantic Halibut",30,1.12206861012956\n'
+    b'"OE-276","Atlantic Halibut",28,0.38380523989899\n'
+    b'"OO-293","Atlantic Halibut",15,2.38090909090909\n'
+)
 
 
 class TestImportScores(CommonTest):
@@ -20,9 +33,46 @@ class TestImportScores(CommonTest):
 
     @tag("Score", "score_import", "import_success")
     def test_import_success(self):
-        result = scripts.import_all_scores(folder_path=TEST_SCORES_FOLDER)
+        with mock.patch.object(tasks.refresh_score_cube, "delay") as refresh_score_cube, \
+                mock.patch.object(tasks.warm_score_cache, "delay") as warm_score_cache, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = scripts.import_all_scores(folder_path=TEST_SCORES_FOLDER)
         assert not result.get('errors')
         assert Score.objects.count() == 8 # 5 from fixtures and 3 imported by this test
+        refresh_score_cube.assert_called_once_with()
+        warm_score_cache.assert_called_once_with()
+
+    @tag("Score", "score_import", "import_upsert")
+    def test_import_upsert(self):
+        csv_file = io.StringIO(
+            '"grid.id","species","sw","fs"\n'
+            '"OO-293","atlantic halibut",30,1.5\n'  # updates the fixture score, species matched case-insensitively
+            '"XX-000","Atlantic Halibut",30,1.5\n'  # no such hexagon
+            '"OO-293","Atlantic Halibut",thirty,1.5\n'
+            '"OO-293","Atlantic Halibut",12,0.25\n'
+        )
+        result = scripts.import_scores_from_reader(csv.DictReader(csv_file))
+        self.assertEqual(result["count_success"], 2)
+        self.assertEqual(len(result["errors"]), 2)
+        scores = Score.objects.filter(hexagon__grid_id="OO-293", species__english_name="Atlantic Halibut")
+        self.assertEqual(float(scores.get(week__week_number=30).fs_score), 1.5)
+        self.assertEqual(float(scores.get(week__week_number=12).fs_score), 0.25)
+
+    @tag("Score", "score_import", "unknown_hexagon")
+    def test_import_unknown_hexagon(self):
+        hexagon_count = Hexagon.objects.count()
+        csv_file = io.StringIO(
+            '"grid.id","species","sw","fs"\n'
+            '"XX-000","Atlantic Halibut",30,1.5\n'
+            '"OT-354","Atlantic Halibut",30,1.5\n'
+        )
+        result = scripts.import_scores_from_reader(csv.DictReader(csv_file))
+        self.assertEqual(result["count_success"], 1)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertIn("there is no hexagon XX-000", result["errors"][0])
+        # reported, not created
+        self.assertEqual(Hexagon.objects.count(), hexagon_count)
+        self.assertFalse(Score.objects.filter(hexagon__grid_id="XX-000").exists())
 
 
 class TestImportVulnerableSpots(CommonTest):
@@ -34,3 +84,153 @@ class TestImportVulnerableSpots(CommonTest):
         result =  scripts.import_all_vulnerable_species_spots(folder_path=TEST_VULNERABLE_SPECIES_SPOTS_FOLDER)
         assert not result.get('errors')
         assert VulnerableSpeciesSpot.objects.count() == 29
+
+
+class TestUploadReader(CommonTest):
+    def setUp(self):
+        super().setUp()
+
+    @tag("Upload", "upload_reader", "streaming")
+    def test_iter_upload_lines(self):
+        # a byte order mark, crlf line endings, a quoted newline and a two byte character split across chunks
+        data = '\ufeff"grid.id","species"\r\n"OT-354","Crabe des neiges é"\r\n"OE-276","two\nlines"'.encode("utf-8")
+        for chunk_size in (1, 2, 3, 64):
+            chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+            self.assertEqual("".join(scripts.iter_upload_lines(chunks)), data.decode("utf-8-sig"))
+            rows = list(csv.DictReader(scripts.iter_upload_lines(chunks)))
+            self.assertEqual([row["grid.id"] for row in rows], ["OT-354", "OE-276"])
+            self.assertEqual(rows[0]["species"], "Crabe des neiges é")
+            self.assertEqual(rows[1]["species"], "two\nlines")
+
+    @tag("Upload", "upload_reader", "import")
+    def test_import_from_upload_reader(self):
+        file = ContentFile(b"\xef\xbb\xbf" + TEST_SCORES_CSV, name="scores.csv")
+        file.DEFAULT_CHUNK_SIZE = 16
+        result = scripts.import_scores_from_reader(scripts.get_upload_reader(file))
+        self.assertFalse(result["errors"])
+        self.assertEqual(result["count_success"], 3)
+
+    @tag("Upload", "upload_reader", "batches")
+    def test_iter_batches(self):
+        self.assertEqual(list(scripts.iter_batches(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(scripts.iter_batches([], 2)), [])
+
+
+class TestImportFolder(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    @tag("Score", "score_import", "import_folder")
+    def test_import_all_scores_merges_files(self):
+        header, *rows = TEST_SCORES_CSV.splitlines(keepends=True)
+        for i, row in enumerate(rows):
+            with open(os.path.join(self.folder.name, f"scores_{i}.csv"), "wb") as f:
+                f.write(header + row)
+        with open(os.path.join(self.folder.name, "unknown_hexagon.csv"), "wb") as f:
+            f.write(header + b'"XX-000","Atlantic Halibut",30,1.5\n')
+        # a single worker: the processes of the pool would not see the data of the test transaction
+        with mock.patch.object(tasks.refresh_score_cube, "delay") as refresh_score_cube, \
+                mock.patch.object(tasks.warm_score_cache, "delay") as warm_score_cache, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = scripts.import_all_scores(folder_path=self.folder.name, workers=1, warm=False)
+        self.assertEqual(result["count_success"], 3)
+        self.assertEqual(len(result["errors"]), 1)
+        refresh_score_cube.assert_not_called()
+        warm_score_cache.assert_not_called()
+
+    @tag("Score", "score_import", "import_folder")
+    def test_bad_first_file(self):
+        # sorted first, and not utf-8: reported as a file error and the other files are still imported
+        with open(os.path.join(self.folder.name, "0_latin_1.csv"), "wb") as f:
+            f.write(TEST_SCORES_CSV.replace(b"Atlantic Halibut", b"Fl\xe9tan atlantique"))
+        with open(os.path.join(self.folder.name, "scores.csv"), "wb") as f:
+            f.write(TEST_SCORES_CSV)
+        with mock.patch.object(tasks.refresh_score_cube, "delay") as refresh_score_cube, \
+                mock.patch.object(tasks.warm_score_cache, "delay") as warm_score_cache, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = scripts.import_all_scores(folder_path=self.folder.name, workers=1)
+        self.assertEqual(result["count_success"], 3)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertIn("0_latin_1.csv", result["errors"][0])
+        refresh_score_cube.assert_called_once_with()
+        warm_score_cache.assert_called_once_with()
+
+    @tag("Score", "score_import", "import_folder")
+    def test_lookups_created_before_import(self):
+        # the files are imported with a read-only context, the species and weeks they name exist beforehand
+        with open(os.path.join(self.folder.name, "scores.csv"), "wb") as f:
+            f.write(TEST_SCORES_CSV.replace(b"Atlantic Halibut", b"Rock Crab").replace(b",30,", b",52,"))
+        contexts = []
+
+        def import_file(path, context):
+            contexts.append(context)
+            self.assertTrue(Species.objects.filter(english_name="Rock Crab").exists())
+            self.assertTrue(Week.objects.filter(week_number=52).exists())
+            return scripts.import_scores_info_from_file_path(path, context)
+
+        result = scripts.import_folder(import_file, scripts.create_score_file_lookups, self.folder.name, workers=1)
+        self.assertFalse(result["errors"])
+        self.assertEqual(result["count_success"], 3)
+        self.assertTrue(contexts[0].read_only)
+
+    @tag("VulnerableSpeciesSpot", "vulnerable_species_spots_import", "import_folder")
+    def test_import_all_vulnerable_species_spots(self):
+        result = scripts.import_all_vulnerable_species_spots(folder_path=TEST_VULNERABLE_SPECIES_SPOTS_FOLDER,
+                                                             workers=1)
+        self.assertFalse(result["errors"])
+        self.assertEqual(result["count_success"], VulnerableSpeciesSpot.objects.count())
+
+
+class TestImportContext(CommonTest):
+    def setUp(self):
+        super().setUp()
+
+    @tag("Import", "import_context", "lookups")
+    def test_lookups(self):
+        context = scripts.ImportContext()
+        self.assertEqual(context.hexagons["OO-293"], Hexagon.objects.get(grid_id="OO-293").id)
+        self.assertEqual(set(context.weeks), set(Week.objects.values_list("week_number", flat=True)))
+        # matched case-insensitively, as english_name__iexact
+        self.assertEqual(context.species["atlantic halibut"], Species.objects.get(english_name="Atlantic Halibut").id)
+
+    @tag("Import", "import_context", "create_missing")
+    def test_create_missing(self):
+        context = scripts.ImportContext()
+        species_count = Species.objects.count()
+        week_numbers = list(context.weeks)
+        self.assertIn("atlantic halibut", context.species)
+        with self.assertNumQueries(1):
+            # known species, in any case, are not created again, a new one is named as first spelled
+            context.create_missing_species(["ATLANTIC HALIBUT", "Rock Crab", "rock crab"])
+        self.assertEqual(Species.objects.count(), species_count + 1)
+        self.assertEqual(context.species["rock crab"], Species.objects.get(english_name="Rock Crab").id)
+        with self.assertNumQueries(0):
+            context.create_missing_species(["Rock crab"])
+            context.create_missing_weeks(week_numbers)
+
+    @tag("Import", "import_context", "read_only")
+    def test_read_only_copy(self):
+        context = scripts.ImportContext().read_only_copy()
+        species_count = Species.objects.count()
+        with self.assertNumQueries(0):
+            self.assertIn("OO-293", context.hexagons)
+            context.create_missing_species(["Rock Crab"])
+        self.assertEqual(Species.objects.count(), species_count)
+        self.assertNotIn("rock crab", context.species)
+
+
+class TestRefreshSpeciesScoreStats(CommonTest):
+    def setUp(self):
+        super().setUp()
+
+    @tag("Score", "score_stats", "refresh")
+    def test_refresh(self):
+        scripts.refresh_species_score_stats()
+        for species_id in Score.objects.values_list("species", flat=True).distinct():
+            season_stats = SpeciesScoreStats.objects.get(species_id=species_id, week__isnull=True)
+            expected_max = Score.objects.filter(species_id=species_id).aggregate(Max("fs_score"))["fs_score__max"]
+            self.assertAlmostEqual(season_stats.max_fs_score, float(expected_max))
+            self.assertEqual(len(season_stats.quantile_breaks), 10)
+            self.assertTrue(SpeciesScoreStats.objects.filter(species_id=species_id, week__isnull=False).exists())
@@ -0,0 +1,105 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+
+from django.test import tag, override_settings
+
+from fisheriescape import caching, tasks
+from fisheriescape.caching import get_score_cache, get_cache_key, count_combined_species_request, bump_data_version
+from fisheriescape.cube import get_score_cube
+from fisheriescape.models import Score, ImportJob, VulnerableSpeciesSpot
+from fisheriescape.test.common_tests import CommonFisheriescapeTest as CommonTest
+from fisheriescape.test.test_scripts import TEST_SCORES_CSV
+
+TEST_DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'test_data')
+
+
+class TestWarmScoreCache(CommonTest):
+    def setUp(self):
+        super().setUp()
+
+    @tag("Score", "cache_warming", "warm")
+    def test_warm_score_cache(self):
+        count_combined_species_request(["Atlantic Halibut", "American Lobster"])
+        # a single worker: the threads of the pool would not see the data of the test transaction
+        results = tasks.warm_score_cache(workers=1)
+        self.assertFalse([result for result in results if result["error"]])
+
+        species_weeks = Score.objects.values_list('species__english_name', 'week__week_number').distinct()
+        self.assertGreaterEqual(len(results), len(species_weeks))
+        cache = get_score_cache()
+        for species, week in species_weeks:
+            self.assertIsNotNone(cache.get(get_cache_key("scores-feature", species=species, week=week,
+                                                         resolution="full", precision=6)))
+        self.assertIsNotNone(cache.get(get_cache_key("scores-feature-combined",
+                                                     species=["American Lobster", "Atlantic Halibut"], week=30,
+                                                     resolution="full", precision=6)))
+
+
+    @tag("Score", "cache_warming", "stale_while_revalidate")
+    def test_warm_after_data_version_bump(self):
+        tasks.warm_score_cache(combined_species_sets=0, workers=1)
+        bump_data_version()
+        # the payloads of the previous version could be served stale: warming must render the new ones itself
+        with mock.patch.object(caching, "_revalidation_executor") as revalidation_executor:
+            results = tasks.warm_score_cache(combined_species_sets=0, workers=1)
+        revalidation_executor.submit.assert_not_called()
+        self.assertFalse([result for result in results if result["error"]])
+        cache = get_score_cache()
+        for species, week in Score.objects.values_list('species__english_name', 'week__week_number').distinct():
+            self.assertIsNotNone(cache.get(get_cache_key("scores-feature", species=species, week=week,
+                                                         resolution="full", precision=6)))
+
+
+class TestRefreshScoreCube(CommonTest):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    @tag("Score", "score_cube", "refresh")
+    def test_refresh_score_cube(self):
+        with override_settings(FISHERIESCAPE_SCORE_CUBE_DIR=self.directory.name):
+            self.assertIsNotNone(tasks.refresh_score_cube())
+            self.assertIsNotNone(get_score_cube())
+            # already of the current score version, which spot and polygon imports leave as it is
+            self.assertIsNone(tasks.refresh_score_cube())
+            bump_data_version()
+            self.assertIsNone(tasks.refresh_score_cube())
+
+
+class TestRunImportJob(CommonTest):
+    def setUp(self):
+        super().setUp()
+
+    def create_job(self, kind, path):
+        with open(path, "rb") as f:
+            return ImportJob.objects.create(kind=kind, file=ContentFile(f.read(), name=os.path.basename(path)))
+
+    @tag("ImportJob", "import_job", "scores")
+    def test_run_scores_import_job(self):
+        job = ImportJob.objects.create(kind="scores", file=ContentFile(TEST_SCORES_CSV, name="scores.csv"))
+        with mock.patch.object(tasks.refresh_score_cube, "delay") as refresh_score_cube, \
+                mock.patch.object(tasks.warm_score_cache, "delay") as warm_score_cache, \
+                self.captureOnCommitCallbacks(execute=True):
+            tasks.run_import_job(job.id)
+        refresh_score_cube.assert_called_once_with()
+        warm_score_cache.assert_called_once_with()
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        self.assertEqual(job.count_success, 3)
+        self.assertFalse(job.errors)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(Score.objects.count(), 8)
+
+    @tag("ImportJob", "import_job", "vulnerable_species_spots")
+    def test_run_vulnerable_species_spots_import_job(self):
+        job = self.create_job("vulnerable_species_spots",
+                              os.path.join(TEST_DATA_FOLDER, "vulnerable_species_spots", "vulnerable_spots.csv"))
+        tasks.run_import_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        self.assertEqual(job.count_success, VulnerableSpeciesSpot.objects.count())
+        self.assertEqual(job.get_progress()["rows_processed"], job.rows_processed)
@@ -6,6 +6,7 @@ from django.test import tag
 from django.views.generic import FormView
 
 from fisheriescape import views
+from fisheriescape.models import ImportJob
 from fisheriescape.test.common_tests import CommonFisheriescapeTest as CommonTest
 
 TEST_VULNERABLE_SPECIES_SPOTS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'test_data',
@@ -38,6 +39,17 @@ class TestVulnerableSpeciesSpotsUploadView(CommonTest):
             data = {"file" : file}
             self.assert_success_url(self.test_url, data=data, user=self.user, expected_code=200)
 
+    @tag("Upload", "import_vulnerable_species_spots", "import_job")
+    def test_import_job(self):
+        # the file is saved as a job for a celery worker, the page then polls its progress
+        with open(file=TEST_VULNERABLE_SPECIES_SPOTS_DATA_PATH, mode="rb") as file:
+            file = ContentFile(content=file.read(), name=os.path.basename(TEST_VULNERABLE_SPECIES_SPOTS_DATA_PATH))
+            response = self.client.post(self.test_url, data={"file": file})
+        job = ImportJob.objects.get()
+        self.assertEqual(job.kind, "vulnerable_species_spots")
+        self.assertEqual(job.status, "pending")
+        self.assertEqual(response.context["import_job"], job)
+
     @tag("Upload", "import_vulnerable_species_spots", "correct_url")
     def test_correct_url(self):
         # use the 'en' locale prefix to url
@@ -69,6 +81,17 @@ class TestFisheriescapeScoresUploadView(CommonTest):
             data = {"file" : file}
             self.assert_success_url(self.test_url, data=data, user=self.user, expected_code=200)
 
+    @tag("Upload", "import_fisheriescape_scores", "import_job")
+    def test_import_job(self):
+        # the file is saved as a job for a celery worker, the page then polls its progress
+        with open(file=TEST_FISHERIES_SCORES_DATA_PATH, mode="rb") as file:
+            file = ContentFile(content=file.read(), name=os.path.basename(TEST_FISHERIES_SCORES_DATA_PATH))
+            response = self.client.post(self.test_url, data={"file": file})
+        job = ImportJob.objects.get()
+        self.assertEqual(job.kind, "scores")
+        self.assertEqual(job.status, "pending")
+        self.assertEqual(response.context["import_job"], job)
+
     @tag("Upload", "import_fisheriescape_scores", "correct_url")
     def test_correct_url(self):
         # use the 'en' locale prefix to url
@@ -0,0 +1,35 @@
+from django.test import tag, SimpleTestCase
+from rest_framework.exceptions import ValidationError
+
+from fisheriescape import utils
+
+
+class TestGeometryResolution(SimpleTestCase):
+
+    @tag("utils", "geometry_resolution")
+    def test_get_geometry_resolution(self):
+        self.assertEqual(utils.get_geometry_resolution(), utils.FULL_RESOLUTION)
+        self.assertEqual(utils.get_geometry_resolution(zoom=5), "low")
+        self.assertEqual(utils.get_geometry_resolution(zoom=8), "medium")
+        self.assertEqual(utils.get_geometry_resolution(zoom=12), utils.FULL_RESOLUTION)
+        self.assertEqual(utils.get_geometry_resolution(tolerance=0.05), "low")
+        self.assertEqual(utils.get_geometry_resolution(tolerance=0.005), "medium")
+        self.assertEqual(utils.get_geometry_resolution(tolerance=0.0001), utils.FULL_RESOLUTION)
+        # the tolerance wins over the zoom level
+        self.assertEqual(utils.get_geometry_resolution(zoom=5, tolerance=0.0001), utils.FULL_RESOLUTION)
+
+    @tag("utils", "geometry_resolution")
+    def test_get_geometry_params(self):
+        self.assertEqual(utils.get_geometry_params({}), (utils.FULL_RESOLUTION, utils.DEFAULT_COORDINATE_PRECISION))
+        self.assertEqual(utils.get_geometry_params({"zoom": "6", "precision": "5"}), ("low", 5))
+        with self.assertRaises(ValidationError):
+            utils.get_geometry_params({"zoom": "far"})
+        with self.assertRaises(ValidationError):
+            utils.get_geometry_params({"precision": "12"})
+
+    @tag("utils", "week")
+    def test_get_week_param(self):
+        self.assertIsNone(utils.get_week_param({}))
+        self.assertEqual(utils.get_week_param({"week": "30"}), 30)
+        with self.assertRaises(ValidationError):
+            utils.get_week_param({"week": "abc"})
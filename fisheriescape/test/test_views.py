@@ -59,11 +59,18 @@ class TestScoreMapView(CommonTest):
     def test_context(self):
         context_vars = [
             "field_list",
-            "lobster_areas",
             "mapbox_api_key",
         ]
         self.assert_presence_of_context_vars(self.test_url, context_vars, user=self.user)
 
+    @tag("ScoreMap", "score_map", "cache_control")
+    def test_cache_control(self):
+        # the area layers come from the api, the page itself can be kept by the browser
+        self.client.force_login(self.user)
+        response = self.client.get(self.test_url)
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertNotIn("lobster_areas", response.context)
+
     @tag("ScoreMap", "score_map", "correct_url")
     def test_correct_url(self):
         # use the 'en' locale prefix to url
@@ -0,0 +1,95 @@
+from django.contrib.gis.geos import GEOSException, GEOSGeometry
+from rest_framework.exceptions import ValidationError
+
+# Precomputed simplified polygons (see models.SimplifiedPolygon), from the coarsest to the finest:
+# (resolution, simplification tolerance in degrees, highest map zoom level the resolution is used for)
+GEOMETRY_RESOLUTIONS = (
+    ("low", 0.01, 6),
+    ("medium", 0.001, 9),
+)
+# the original polygons, used above the last zoom level of GEOMETRY_RESOLUTIONS
+FULL_RESOLUTION = "full"
+
+# number of decimals of the coordinates in GeoJSON output; 6 decimals is about 10 cm
+DEFAULT_COORDINATE_PRECISION = 6
+MAX_COORDINATE_PRECISION = 9
+
+
+def get_geometry_resolution(zoom=None, tolerance=None):
+    """
+    Return the name of the precomputed resolution that fits a simplification tolerance or, failing that, a map zoom
+    level. The full resolution is returned when neither is given.
+    :param zoom: map zoom level
+    :param tolerance: largest acceptable simplification tolerance, in degrees
+    """
+    if tolerance is not None:
+        for resolution, resolution_tolerance, max_zoom in GEOMETRY_RESOLUTIONS:
+            if resolution_tolerance <= tolerance:
+                return resolution
+        return FULL_RESOLUTION
+
+    if zoom is not None:
+        for resolution, resolution_tolerance, max_zoom in GEOMETRY_RESOLUTIONS:
+            if zoom <= max_zoom:
+                return resolution
+    return FULL_RESOLUTION
+
+
+def get_geometry_params(query_params):
+    """
+    Read the `zoom`, `tolerance` and `precision` parameters of an api request.
+    :return: a (resolution, precision) tuple
+    """
+    try:
+        zoom = int(query_params["zoom"]) if query_params.get("zoom") else None
+        tolerance = float(query_params["tolerance"]) if query_params.get("tolerance") else None
+        precision = int(query_params.get("precision") or DEFAULT_COORDINATE_PRECISION)
+    except ValueError:
+        raise ValidationError("zoom and precision must be integers and tolerance a number.")
+
+    if not 0 <= precision <= MAX_COORDINATE_PRECISION:
+        raise ValidationError(f"precision must be between 0 and {MAX_COORDINATE_PRECISION}.")
+    return get_geometry_resolution(zoom=zoom, tolerance=tolerance), precision
+
+
+def get_week_param(query_params):
+    """
+    Read the `week` parameter of an api request.
+    :return: the week number, None if it is not given
+    """
+    if not query_params.get("week"):
+        return None
+    try:
+        return int(query_params["week"])
+    except ValueError:
+        raise ValidationError("The week parameter must be a week number.")
+
+
+def get_spatial_filter_params(query_params, data=None):
+    """
+    Read the spatial filters of a score api request: `bbox` (min lon, min lat, max lon, max lat), `fishery_area` and
+    `nafo_area` (ids) from the query string, and `polygon` (WKT, in WGS84) from the body of a POST request.
+    :return: a dict of the filters given, to be passed on to the queries and included in the cache keys
+    """
+    spatial_filter = {}
+    try:
+        if query_params.get("bbox"):
+            bbox = tuple(float(coordinate) for coordinate in query_params["bbox"].split(","))
+            if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                raise ValueError
+            spatial_filter["bbox"] = bbox
+        for layer in ("fishery_area", "nafo_area"):
+            if query_params.get(layer):
+                spatial_filter[layer] = int(query_params[layer])
+    except ValueError:
+        raise ValidationError("bbox must be min lon,min lat,max lon,max lat and fishery_area and nafo_area ids.")
+
+    if data and data.get("polygon"):
+        try:
+            polygon = GEOSGeometry(data["polygon"], srid=4326)
+        except (GEOSException, ValueError):
+            raise ValidationError("polygon must be a WKT polygon.")
+        if polygon.geom_type not in ("Polygon", "MultiPolygon") or not polygon.valid:
+            raise ValidationError("polygon must be a valid WKT polygon.")
+        spatial_filter["polygon"] = polygon.wkt
+    return spatial_filter
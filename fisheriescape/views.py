@@ -1,5 +1,3 @@
-import csv
-import io
 from copy import deepcopy
 
 from django.conf import settings
@@ -7,10 +5,12 @@ from django.utils.translation import gettext as _, gettext_lazy
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.db import transaction
 from django.db.models import TextField, Value
 from django.db.models.functions import Concat
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
 from django.urls import reverse_lazy, reverse
 from django.views.generic import TemplateView, FormView
 from django.contrib.auth.models import User, Group
@@ -21,7 +21,7 @@ from shared_models.views import CommonFilterView, CommonCreateView, CommonDetail
 from . import models
 from . import forms
 from . import filters
-from .scripts import import_vulnerable_species_from_reader, import_scores_from_reader
+from .tasks import run_import_job
 
 
 class CloserTemplateView(TemplateView):
@@ -187,18 +187,25 @@ class SpeciesHardDeleteView(FisheriescapeAdminAccessRequired, CommonHardDeleteVi
 # #
 #
 
-class MapView(FisheriescapeAccessRequired, TemplateView):
+class MapShellMixin:
+    """
+    The map pages are a shell around data fetched from the api (area layers, scores), the browser can keep them for a
+    while
+    """
+    shell_max_age = 60 * 60
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        patch_cache_control(response, private=True, max_age=self.shell_max_age)
+        return response
+
+
+class MapView(FisheriescapeAccessRequired, MapShellMixin, TemplateView):
     template_name = "fisheriescape/map.html"
 
     def get_context_data(self, **kwargs):
         """Return the view context data."""
         context = super().get_context_data(**kwargs)
-        context["lobster_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Lobster"))
-        context["snow_crab_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Crab"))
-        context["herring_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Herring"))
-        context["groundfish_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Groundfish"))
-        context["nafo_sub_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="NAFO Subareas"))
-        context["nafo_areas"] = serialize("geojson", models.NAFOArea.objects.filter(layer_id="NAFO"))
         context["mapbox_api_key"] = settings.MAPBOX_API_KEY
         return context
 
@@ -503,7 +510,7 @@ class FisheryDeleteView(FisheriescapeAdminAccessRequired, CommonDeleteView):
 # #
 #
 
-class ScoreMapView(FisheriescapeAccessRequired, CommonTemplateView):
+class ScoreMapView(FisheriescapeAccessRequired, MapShellMixin, CommonTemplateView):
     h1 = gettext_lazy("Score map")
     template_name = "fisheriescape/search_map.html"
     field_list = [
@@ -519,13 +526,6 @@ class ScoreMapView(FisheriescapeAccessRequired, CommonTemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        context["lobster_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Lobster"))
-        context["snow_crab_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Crab"))
-        context["herring_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Herring"))
-        context["groundfish_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="Groundfish"))
-        context["nafo_sub_areas"] = serialize("geojson", models.FisheryArea.objects.filter(layer_id="NAFO Subareas"))
-        context["nafo_areas"] = serialize("geojson", models.NAFOArea.objects.filter(layer_id="NAFO"))
-
         context["mapbox_api_key"] = settings.MAPBOX_API_KEY
 
         return context
@@ -538,39 +538,33 @@ class ScoreMapView(FisheriescapeAccessRequired, CommonTemplateView):
 # #
 #
 
-class ImportVulnerableSpeciesSpotsView(FisheriescapeAdminAccessRequired, FormView):
-    h1 = gettext_lazy("Import vulnerable species spots")
-    template_name = "fisheriescape/import_vulnerable_species_spots.html"
-    form_class = forms.VulnerableSpeciesSpotForm
-    is_multipart_form_data = True
+class ImportJobFormMixin:
+    """Save the uploaded csv file as an ImportJob, imported by a celery worker, see tasks.run_import_job"""
+    import_kind = None
 
     def post(self, *args, **kwargs):
-        context = super().get_context_data(**kwargs)
         form = self.form_class(self.request.POST, self.request.FILES)
+        context = super().get_context_data(form=form, **kwargs)
         if form.is_valid():
-            file = form.cleaned_data['file']
-            csv_file = io.StringIO(file.read().decode('utf-8'))
-            reader = csv.DictReader(csv_file, delimiter=',', quotechar='"')
-            result = import_vulnerable_species_from_reader(reader)
-            context["post_result"] = result
+            job = models.ImportJob.objects.create(kind=self.import_kind, file=form.cleaned_data['file'],
+                                                  created_by=self.request.user)
+            transaction.on_commit(lambda: run_import_job.delay(job.id))
+            context["import_job"] = job
 
-        return super(ImportVulnerableSpeciesSpotsView, self).render_to_response(context)
+        return self.render_to_response(context)
 
 
-class ImportFisheriescapeScoresView(FisheriescapeAdminAccessRequired, FormView):
+class ImportVulnerableSpeciesSpotsView(FisheriescapeAdminAccessRequired, ImportJobFormMixin, FormView):
+    h1 = gettext_lazy("Import vulnerable species spots")
+    template_name = "fisheriescape/import_vulnerable_species_spots.html"
+    form_class = forms.VulnerableSpeciesSpotForm
+    is_multipart_form_data = True
+    import_kind = "vulnerable_species_spots"
+
+
+class ImportFisheriescapeScoresView(FisheriescapeAdminAccessRequired, ImportJobFormMixin, FormView):
     h1 = gettext_lazy("Import Fisheriescape Scores")
     template_name = "fisheriescape/import_fisheriescape_scores.html"
     form_class = forms.ScoresForm
     is_multipart_form_data = True
-
-    def post(self, *args, **kwargs):
-        context = super().get_context_data(**kwargs)
-        form = self.form_class(self.request.POST, self.request.FILES)
-        if form.is_valid():
-            file = form.cleaned_data['file']
-            csv_file = io.StringIO(file.read().decode('utf-8'))
-            reader = csv.DictReader(csv_file, delimiter=',', quotechar='"')
-            result = import_scores_from_reader(reader)
-            context["post_result"] = result
-
-        return super(ImportFisheriescapeScoresView, self).render_to_response(context)
+    import_kind = "scores"